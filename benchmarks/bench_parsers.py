@@ -0,0 +1,160 @@
+"""Offline benchmark of the tweet and profile parsers on recorded xcancel pages.
+
+Runs every parser function against the HTML fixtures in ``fixtures/`` and
+reports items per second (best of ``--repeat`` runs) and the memory allocated
+per item. No browser, network or MongoDB is needed: attachments are handed to
+a stub downloader and the attachments collection is a stub.
+
+    python benchmarks/bench_parsers.py
+    python benchmarks/bench_parsers.py --json after.json --compare before.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from dedup_index import HashScope
+from fetcher import Page
+from scraper import (
+    extract_quote,
+    extract_tweet_metadata,
+    parse_joindate,
+    parse_page,
+    parse_tweet,
+    scrape_profile_info,
+)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+TIMELINE_FIXTURES = ["timeline_page.html"]
+THREAD_FIXTURES = ["thread_page.html"]
+ERROR_FIXTURES = ["error_not_found.html", "error_suspended.html", "timeline_end.html"]
+REPEAT = 5
+
+
+class StubCollection:
+    """Stands in for the attachments collection; nothing is ever written to it."""
+
+    name = "attachments"
+
+
+class StubDownloader:
+    """Records attachment requests instead of downloading them."""
+
+    def __init__(self):
+        self.attached = 0
+
+    def attach(self, attachments_con: Any, doc: Dict[str, Any], urls: List[str]) -> None:
+        self.attached += len(urls)
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def fixture_page(name: str) -> Page:
+    return Page(f"https://xcancel.com/fixtures/{name}", load_fixture(name), 200, {}, "fixture", 0)
+
+
+def tweet_soups(names: List[str], tweet_class: str) -> List[BeautifulSoup]:
+    """The per-tweet soups ``scrape_tweets`` hands to ``parse_tweet``."""
+    soups = []
+    for name in names:
+        page_soup = BeautifulSoup(load_fixture(name), "html.parser")
+        for tweet in page_soup.find_all(class_=tweet_class):
+            tweet_soup = tweet.find("div")
+            if tweet_soup is not None:
+                soups.append(tweet_soup)
+    return soups
+
+
+def measure(func: Callable[[Any], Any], items: List[Any], repeat: int) -> Dict[str, float]:
+    """Best-of-``repeat`` throughput and peak allocation per item of ``func`` over ``items``."""
+    best = float("inf")
+    with contextlib.redirect_stdout(io.StringIO()):  # parser progress messages
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for item in items:
+                func(item)
+            best = min(best, time.perf_counter() - start)
+
+        # Results are kept alive so the peak covers everything a pass allocates
+        tracemalloc.start()
+        results = [func(item) for item in items]
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    del results
+    return {"items": len(items), "items_per_sec": len(items) / best, "kib_per_item": peak / 1024 / len(items)}
+
+
+def run_benchmarks(repeat: int) -> Dict[str, Dict[str, float]]:
+    timeline = tweet_soups(TIMELINE_FIXTURES, "timeline-item")
+    thread = tweet_soups(THREAD_FIXTURES, "reply")
+    tweets = timeline + thread
+    quotes = [t for t in tweets if t.find("div", class_="quote")]
+    profile_card = BeautifulSoup(load_fixture(TIMELINE_FIXTURES[0]), "html.parser").find(class_="profile-card")
+    profile_info = scrape_profile_info(profile_card)
+    pages = [fixture_page(name) for name in TIMELINE_FIXTURES + THREAD_FIXTURES + ERROR_FIXTURES]
+    attachments_con = StubCollection()
+    downloader = StubDownloader()
+
+    def parse_timeline_tweet(soup: BeautifulSoup) -> Any:
+        return parse_tweet(soup, HashScope(), attachments_con, True, 0, True, profile_info, downloader)
+
+    def parse_reply(soup: BeautifulSoup) -> Any:
+        return parse_tweet(soup, HashScope(), attachments_con, False, 0, True, downloader=downloader)
+
+    def find_error_panel(page: Page) -> Any:
+        return parse_page(page).find(class_="error-panel")
+
+    return {
+        "parse_page": measure(parse_page, pages, repeat),
+        "parse_page+error_panel": measure(find_error_panel, [fixture_page(name) for name in ERROR_FIXTURES], repeat),
+        "parse_tweet (timeline)": measure(parse_timeline_tweet, timeline, repeat),
+        "parse_tweet (thread)": measure(parse_reply, thread, repeat),
+        "extract_tweet_metadata": measure(extract_tweet_metadata, tweets, repeat),
+        "extract_quote": measure(lambda soup: extract_quote(soup, attachments_con, True, downloader), quotes, repeat),
+        "parse_joindate": measure(parse_joindate, [profile_card], repeat * 100),
+        "scrape_profile_info": measure(scrape_profile_info, [profile_card], repeat * 100),
+    }
+
+
+def print_results(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]] = None) -> None:
+    print(f"{'benchmark':<26} {'items':>6} {'items/sec':>12} {'KiB/item':>10}")
+    for name, r in results.items():
+        line = f"{name:<26} {r['items']:>6} {r['items_per_sec']:>12.1f} {r['kib_per_item']:>10.1f}"
+        if baseline and name in baseline:
+            speedup = r["items_per_sec"] / baseline[name]["items_per_sec"]
+            memory = r["kib_per_item"] / baseline[name]["kib_per_item"]
+            line += f"   {speedup:.2f}x speed, {memory:.2f}x memory vs. baseline"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline parser benchmarks on recorded xcancel fixtures.")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="Timed runs per benchmark, the best one is reported.")
+    parser.add_argument("--json", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare against.")
+    args = parser.parse_args()
+
+    results = run_benchmarks(max(1, args.repeat))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
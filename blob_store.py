@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from typing import BinaryIO
+import gridfs
+from bson.objectid import ObjectId
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+BLOB_BUCKET = "blobs"
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore(ABC):
+    """Content-addressed storage for attachment binaries, keyed by SHA-256 hex digest."""
+
+    @abstractmethod
+    def exists(self, sha256: str) -> bool:
+        ...
+
+    @abstractmethod
+    def put(self, sha256: str, stream: BinaryIO) -> bool:
+        """Stores ``stream`` under ``sha256`` unless present; returns True if it was new."""
+
+    @abstractmethod
+    def open(self, sha256: str) -> BinaryIO:
+        """Returns a readable stream of the blob."""
+
+    def copy_to(self, sha256: str, filename: str) -> None:
+        """Streams a blob into a file without loading it into memory."""
+        with self.open(sha256) as src, open(filename, "wb") as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+class GridFSBlobStore(BlobStore):
+    """Blobs in a GridFS bucket of the scraper database, one file per digest.
+
+    A unique index on the file name makes the database reject a second copy
+    when two workers store the same blob at once; the chunks of the losing
+    upload are deleted again.
+    """
+
+    def __init__(self, db: Database, bucket_name: str = BLOB_BUCKET):
+        self.bucket = gridfs.GridFSBucket(db, bucket_name=bucket_name, chunk_size_bytes=CHUNK_SIZE)
+        self.files = db[f"{bucket_name}.files"]
+        self.chunks = db[f"{bucket_name}.chunks"]
+        try:
+            self.files.create_index("filename", name="filename_unique", unique=True)
+        except OperationFailure as e:
+            # Blobs stored by racing workers before the index existed
+            print(f"Could not create unique index filename_unique on {self.files.name} ({e.details.get('codeName', e.code)}), duplicate blobs remain possible. Remove the duplicates to enforce uniqueness.")
+
+    def exists(self, sha256: str) -> bool:
+        return self.files.find_one({"filename": sha256}, {"_id": 1}) is not None
+
+    def put(self, sha256: str, stream: BinaryIO) -> bool:
+        if self.exists(sha256):
+            return False
+        file_id = ObjectId()
+        try:
+            self.bucket.upload_from_stream_with_id(file_id, sha256, stream)
+        except DuplicateKeyError:
+            self.chunks.delete_many({"files_id": file_id})  # Stored by another worker meanwhile
+            return False
+        return True
+
+    def open(self, sha256: str) -> BinaryIO:
+        return self.bucket.open_download_stream_by_name(sha256)
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs in a local directory sharded by the first two digest bytes (ab/cd/abcd...)."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256: str) -> bool:
+        return os.path.exists(self.path(sha256))
+
+    def put(self, sha256: str, stream: BinaryIO) -> bool:
+        target = self.path(sha256)
+        if os.path.exists(target):
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Write to a temporary file first so a crash never leaves a truncated blob
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(stream, f, CHUNK_SIZE)
+            os.replace(tmp, target)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return True
+
+    def open(self, sha256: str) -> BinaryIO:
+        return open(self.path(sha256), "rb")
+
+
+def open_blob_store(kind: str, db: Database, root: str = "./blobs") -> BlobStore:
+    """Returns the blob store selected on the command line."""
+    if kind == "local":
+        return LocalBlobStore(root)
+    return GridFSBlobStore(db)
@@ -0,0 +1,186 @@
+import atexit
+import signal
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Tuple, Union
+import bson
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+import pymongo.collection
+from pymongo import InsertOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+from telemetry import metrics
+
+MAX_BATCH = 500
+MAX_DELAY = 2.0  # seconds a document may wait in a queue before it is flushed
+MAX_DOCUMENT_SIZE = 16 * 1024 * 1024
+BACKPRESSURE_BATCHES = 10  # queued batches per collection before inserts block on a flush
+
+_writers: "weakref.WeakSet[BulkWriter]" = weakref.WeakSet()
+_sigterm_installed = False
+
+
+def _close_writers() -> None:
+    for writer in list(_writers):
+        writer.close()
+
+
+def _on_sigterm(signum: int, frame: Any) -> None:
+    # Flushing here could deadlock on a lock the interrupted code holds, the
+    # callers' finally blocks and the exit hook write what is left instead
+    raise SystemExit(128 + signum)
+
+
+atexit.register(_close_writers)
+
+
+class BulkWriter:
+    """Buffers inserts and updates per collection and writes them with unordered bulk writes.
+
+    Queues are handed to a background thread when they reach ``max_batch``
+    documents or every ``max_delay`` seconds, so the scraper never waits on a
+    MongoDB round trip unless the database falls far behind. Everything still
+    queued is written on interpreter exit or SIGTERM. Documents are BSON-encoded
+    once when queued, so an oversized document is rejected on its own instead
+    of failing the whole batch.
+    """
+
+    def __init__(self, max_batch: int = MAX_BATCH, max_delay: float = MAX_DELAY):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.queues: Dict[str, Tuple[pymongo.collection.Collection, List[Union[InsertOne, UpdateOne, UpdateMany]]]] = {}
+        self.written = 0
+        self.updated = 0  # Upserts that matched an existing document
+        self.rejected = 0
+        self.batches = 0
+        self.seconds = 0.0
+        self.closed = False
+        self.wake = threading.Event()
+        self.flusher = threading.Thread(target=metrics.bind(self._flush_periodically), name="bulk-writer", daemon=True)
+        self.flusher.start()
+        _writers.add(self)
+        global _sigterm_installed
+        if not _sigterm_installed and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, _on_sigterm)
+            _sigterm_installed = True
+
+    def _flush_periodically(self) -> None:
+        while not self.closed:
+            self.wake.wait(self.max_delay)
+            self.wake.clear()
+            self.flush()
+
+    def _encode(self, col: pymongo.collection.Collection, doc: Dict[str, Any], name: Any) -> Optional[RawBSONDocument]:
+        encoded = bson.encode(doc)
+        if len(encoded) > MAX_DOCUMENT_SIZE:
+            with self.lock:
+                self.rejected += 1
+            print(f"Document {name} for {col.name} too large to store in database ({len(encoded)} bytes), skipping.")
+            return None
+        return RawBSONDocument(encoded)
+
+    def insert(self, col: pymongo.collection.Collection, doc: Dict[str, Any]) -> None:
+        """Queues ``doc`` for ``col``; sets ``_id`` on the document like ``insert_one``."""
+        doc.setdefault("_id", ObjectId())
+        encoded = self._encode(col, doc, doc["_id"])
+        if encoded is not None:
+            self._queue(col, InsertOne(encoded))
+
+    def update(self, col: pymongo.collection.Collection, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, many: bool = False) -> None:
+        """Queues an ``update_one`` (or ``update_many``) of ``query`` for ``col``."""
+        encoded = self._encode(col, update, query)
+        if encoded is not None:
+            self._queue(col, UpdateMany(query, encoded, upsert=upsert) if many else UpdateOne(query, encoded, upsert=upsert))
+
+    def _queue(self, col: pymongo.collection.Collection, operation: Union[InsertOne, UpdateOne, UpdateMany]) -> None:
+        with self.lock:
+            if col.full_name not in self.queues:
+                self.queues[col.full_name] = (col, [])
+            queue = self.queues[col.full_name][1]
+            queue.append(operation)
+            queued = len(queue)
+            total = sum(len(q) for _, q in self.queues.values())
+        metrics.set("scraper_queue_depth", total, stage="db")
+        if queued >= BACKPRESSURE_BATCHES * self.max_batch:
+            self.flush()  # The database fell behind, write on the caller's thread
+        elif queued >= self.max_batch:
+            self.wake.set()
+
+    def _write(self, col: pymongo.collection.Collection, batch: List[Union[InsertOne, UpdateOne, UpdateMany]]) -> None:
+        start = time.monotonic()
+        written = updated = rejected = 0
+        try:
+            result = col.bulk_write(batch, ordered=False)
+            written = result.inserted_count + result.upserted_count
+            updated = result.matched_count
+        except BulkWriteError as e:
+            # Unordered: everything but the failing documents was written
+            written = e.details.get("nInserted", 0) + e.details.get("nUpserted", 0)
+            updated = e.details.get("nMatched", 0)
+            rejected = len(e.details.get("writeErrors", []))
+            for error in e.details.get("writeErrors", []):
+                print(f"Bulk write to {col.name} rejected a document: {error.get('errmsg')}")
+        seconds = time.monotonic() - start
+        with self.lock:
+            self.written += written
+            self.updated += updated
+            self.rejected += rejected
+            self.batches += 1
+            self.seconds += seconds
+        metrics.observe("db_write", seconds, collection=col.name)
+        metrics.inc("scraper_documents_total", written, collection=col.name)
+        metrics.event("bulk_write", collection=col.name, documents=written, updated=updated, rejected=rejected, seconds=round(seconds, 3))
+
+    def flush(self) -> None:
+        """Writes all queued documents."""
+        with self.write_lock:
+            with self.lock:
+                batches = [(col, queue) for col, queue in self.queues.values() if queue]
+                self.queues = {}
+            metrics.set("scraper_queue_depth", 0, stage="db")
+            for col, queue in batches:
+                self._write(col, queue)
+
+    def report(self) -> None:
+        print(f"Bulk writer: {self.written} new documents, {self.updated} updated in {self.batches} batches ({self.seconds:.1f}s in MongoDB), {self.rejected} rejected.")
+
+    def close(self) -> None:
+        """Stops the background flusher and writes what is left."""
+        if self.closed:
+            return
+        self.closed = True
+        self.wake.set()
+        self.flush()
+
+
+class BufferedCollection:
+    """Collection proxy whose ``insert_one``, upserts and ``update_many`` go through a ``BulkWriter``.
+
+    Other updates flush the writer first so they apply after every queued write.
+    Everything else (queries, counts, ``database``) is delegated to the wrapped
+    collection, so it can be passed anywhere a collection is expected.
+    """
+
+    def __init__(self, col: pymongo.collection.Collection, writer: BulkWriter):
+        self.collection = col
+        self.writer = writer
+
+    def insert_one(self, doc: Dict[str, Any]) -> None:
+        self.writer.insert(self.collection, doc)
+
+    def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, **kwargs: Any) -> Any:
+        if upsert and not kwargs:
+            self.writer.update(self.collection, filter, update, upsert=True)
+            return None
+        self.writer.flush()
+        with metrics.timer("db_write", collection=self.collection.name):
+            return self.collection.update_one(filter, update, upsert=upsert, **kwargs)
+
+    def update_many(self, filter: Dict[str, Any], update: Dict[str, Any]) -> None:
+        self.writer.update(self.collection, filter, update, many=True)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.collection, name)
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+import pymongo.collection
+from pymongo import UpdateOne
+from bulk_writer import BulkWriter
+
+CHECKPOINT_MAX_AGE_DAYS = 14  # Older checkpoints are considered stale and ignored
+
+
+class CheckpointStore:
+    """Crawl state per URL in MongoDB, so an interrupted run resumes where it stopped.
+
+    Timeline and conversation checkpoints hold the last "Load more" cursor URL,
+    the number of items scraped and the tweets with replies found so far; deep
+    crawl checkpoints hold the pending frontier, and every thread already done
+    is marked by a small document of its own. Thread checkpoints hold the
+    conversations a timeline pass found that were not scraped yet.
+    Before a checkpoint is written the bulk writer is flushed, so a resumed
+    run never skips documents that were only buffered.
+    """
+
+    def __init__(self, col: pymongo.collection.Collection, writer: Optional[BulkWriter] = None, max_age_days: int = CHECKPOINT_MAX_AGE_DAYS):
+        self.col = col
+        self.writer = writer
+        self.max_age = timedelta(days=max_age_days)
+
+    def _save(self, key: str, kind: str, state: Dict[str, Any]) -> None:
+        if self.writer is not None:
+            self.writer.flush()
+        self.col.update_one(
+            {"_id": key},
+            {"$set": {**state, "kind_str": kind, "updated_utc_iso": datetime.utcnow().isoformat()}},
+            upsert=True,
+        )
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns the checkpoint of ``key`` unless it is missing or stale."""
+        checkpoint = self.col.find_one({"_id": key})
+        if checkpoint is None:
+            return None
+        if datetime.utcnow() - datetime.fromisoformat(checkpoint["updated_utc_iso"]) > self.max_age:
+            print(f"Ignoring stale checkpoint for {key}.")
+            return None
+        return checkpoint
+
+    def save_cursor(self, url: str, cursor_url: str, items_seen: int, with_replies: List[str]) -> None:
+        self._save(url, "pagination", {"cursor_url_str": cursor_url, "items_seen_int": items_seen, "with_replies_list": with_replies})
+
+    def save_threads(self, url: str, pending: List[List[Any]]) -> None:
+        """Stores the conversations of a timeline pass that are still to be scraped, as ``[tweet_id, score]``."""
+        self._save(f"threads:{url}", "threads", {"pending_list": pending})
+
+    def save_frontier(self, root: str, pending: List[List[Any]], done: List[str]) -> None:
+        """Replaces the pending frontier of ``root`` and marks the threads in ``done`` as finished."""
+        if done:
+            if self.writer is not None:
+                self.writer.flush()
+            now = datetime.utcnow().isoformat()
+            self.col.bulk_write([UpdateOne(
+                {"_id": f"crawl:{root}|{url}"},
+                {"$set": {"kind_str": "done", "root_str": root, "url_str": url, "updated_utc_iso": now}},
+                upsert=True,
+            ) for url in done], ordered=False)
+        self._save(f"crawl:{root}", "frontier", {"pending_list": pending})
+        self.col.update_one({"_id": f"crawl:{root}", "done_list": {"$exists": True}}, {"$unset": {"done_list": ""}})
+
+    def load_done(self, root: str) -> List[str]:
+        """Threads of the reply crawl of ``root`` that are done."""
+        return [d["url_str"] for d in self.col.find({"kind_str": "done", "root_str": root}, {"url_str": 1})]
+
+    def clear(self, key: str) -> None:
+        self.col.delete_one({"_id": key})
+
+    def clear_frontier(self, root: str) -> None:
+        self.col.delete_many({"kind_str": "done", "root_str": root})
+        self.clear(f"crawl:{root}")
+
+    def list(self) -> List[Dict[str, Any]]:
+        return list(self.col.find({"kind_str": {"$ne": "done"}}, {"pending_list": 0, "done_list": 0, "with_replies_list": 0}).sort("updated_utc_iso", pymongo.ASCENDING))
+
+    def clear_older_than(self, days: int) -> int:
+        """Deletes checkpoints not updated for ``days`` days (all for 0); returns how many."""
+        cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
+        return self.col.delete_many({"updated_utc_iso": {"$lte": cutoff}}).deleted_count
+
+
+def print_checkpoints(store: CheckpointStore) -> None:
+    checkpoints = store.list()
+    for c in checkpoints:
+        position = c.get("cursor_url_str", "")
+        items = c.get("items_seen_int", "")
+        print(f"{c['updated_utc_iso']}  {c['kind_str']:<10}  {c['_id']}  {items}  {position}")
+    print(f"{len(checkpoints)} checkpoints.")
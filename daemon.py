@@ -0,0 +1,435 @@
+import argparse
+import heapq
+import itertools
+import json
+import os
+import socketserver
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from rate_limit import PolitenessBudget
+from scraper import build_parser, parse_arguments, scrape_profiles, tweet_url
+from telemetry import metrics
+
+LISTEN = "127.0.0.1:8765"
+SCHEDULE_FILE = "./schedules.json"
+SCHEDULER_TICK_SECONDS = 30
+JOB_HISTORY = 1000  # Finished jobs kept for the status endpoints
+API_PRIORITY = 10  # Requests run before scheduled jobs of the same lane
+SCHEDULE_PRIORITY = 0
+MAX_WAIT_SECONDS = 600
+LANES = ["tweet", "profile"]
+# Options a request may set; everything else is fixed when the daemon starts
+REQUEST_OPTIONS = [
+    "profile", "tweet", "max_comments", "max_tweets", "attachments", "waiting_time", "force", "deep",
+    "max_depth", "max_per_depth", "max_per_root", "max_thread_pages", "refresh_stats", "refresh_older_than", "refresh_limit",
+]
+FLAG_OPTIONS = ["deep", "refresh_stats"]  # Given without a value on the command line
+STARTUP_EXCLUDED = ["profile", "profiles_file", "profiles_collection", "tweet", "refresh_stats", "enqueue", "worker", "jobs", "list_checkpoints", "index_report", "page_budget"]
+
+
+class RequestParser(argparse.ArgumentParser):
+    """Raises instead of printing usage and exiting, so a bad request does not stop the daemon."""
+
+    def error(self, message: str) -> None:
+        raise ValueError(message)
+
+
+def request_args(defaults: argparse.Namespace, params: Dict[str, Any]) -> argparse.Namespace:
+    """Options of a scrape request: the daemon's options overridden by ``params``, validated like the command line.
+
+    ``params`` maps option names (``max_comments`` or ``max-comments``) to values;
+    ``deep`` and ``refresh_stats`` also take ``true``.
+    """
+    params = {key.replace("-", "_"): value for key, value in params.items()}
+    unknown = sorted(set(params) - set(REQUEST_OPTIONS))
+    if unknown:
+        raise ValueError(f"unknown or daemon-wide options: {', '.join(unknown)}")
+    argv: List[str] = []
+    for key, value in params.items():
+        flag = "--" + key.replace("_", "-")
+        if key in FLAG_OPTIONS:
+            if value is True:
+                argv.append(flag)
+            elif value:
+                argv += [flag, str(value)]
+        elif value is not None:
+            argv += [flag, str(value)]
+    try:
+        parsed = parse_arguments(argv, build_parser(RequestParser))
+    except SystemExit:
+        raise ValueError("invalid options")
+    if parsed.refresh_stats and defaults.page_cache:
+        raise ValueError("a stats refresh needs current pages, start the daemon without --page-cache")
+    args = argparse.Namespace(**vars(defaults))
+    for key in params:
+        setattr(args, key, getattr(parsed, key))
+    return args
+
+
+class DaemonQueue:
+    """Scrape requests of the daemon, kept in memory and run by ``scrape_profiles`` like ``JobQueue`` jobs.
+
+    Jobs are split into lanes, each consumed by its own ``scrape_profiles``
+    with its own browser: single tweets go to the ``tweet`` lane, so an
+    analyst's request does not wait for a profile that takes hours. Within a
+    lane higher priority runs first, then oldest first. Finished jobs are kept
+    for the status endpoints, the last ``history`` of them.
+    """
+
+    def __init__(self, history: int = JOB_HISTORY):
+        self.history = history
+        self.cond = threading.Condition()
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.pending: Dict[str, List[Tuple[int, int, str]]] = {lane: [] for lane in LANES}
+        self.progress: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self.seq = itertools.count()
+        self.started = time.time()
+        self.stopped = False
+
+    def submit(self, args: argparse.Namespace, params: Dict[str, Any], priority: int = API_PRIORITY, source: str = "api") -> Dict[str, Any]:
+        profile_url = f"https://xcancel.com/{args.profile}"
+        lane = "tweet" if args.tweet else "profile"
+        job = {
+            "_id": uuid.uuid4().hex[:12],
+            "kind_str": "request",
+            "target_str": tweet_url(profile_url, args.tweet) if args.tweet else profile_url,
+            "profile_str": args.profile,
+            "lane_str": lane,
+            "source_str": source,
+            "priority_int": priority,
+            "params": params,
+            "payload": {"args": args},
+            "state_str": "queued",
+            "queued_utc_iso": datetime.utcnow().isoformat(),
+        }
+        with self.cond:
+            self.jobs[job["_id"]] = job
+            heapq.heappush(self.pending[lane], (-priority, next(self.seq), job["_id"]))
+            self.cond.notify_all()
+        return job
+
+    def iter_jobs(self, lane: str) -> Iterator[Dict[str, Any]]:
+        """Yields the jobs of ``lane`` as they come in, until ``stop``."""
+        while True:
+            with self.cond:
+                job = None
+                while job is None and not self.stopped:
+                    if not self.pending[lane]:
+                        self.cond.wait(1.0)  # Timed, so Ctrl+C gets through
+                        continue
+                    _, _, job_id = heapq.heappop(self.pending[lane])
+                    if self.jobs.get(job_id, {}).get("state_str") == "queued":  # Not cancelled
+                        job = self.jobs[job_id]
+                if job is None:
+                    return
+                job["state_str"] = "running"
+                job["started_utc_iso"] = datetime.utcnow().isoformat()
+            yield job
+
+    @contextmanager
+    def lease(self, job: Dict[str, Any], progress: Optional[Callable[[], Dict[str, Any]]] = None) -> Iterator[None]:
+        """Makes the progress of ``job`` visible to the status endpoints while it runs."""
+        if progress is not None:
+            self.progress[job["_id"]] = progress
+        try:
+            yield
+        finally:
+            self.progress.pop(job["_id"], None)
+
+    def _finish(self, job: Dict[str, Any], state: str, **fields: Any) -> None:
+        with self.cond:
+            job.update(state_str=state, finished_utc_iso=datetime.utcnow().isoformat(), **fields)
+            job["payload"] = {}
+            finished = [i for i, j in self.jobs.items() if j["state_str"] not in ["queued", "running"]]
+            for job_id in finished[:max(0, len(finished) - self.history)]:
+                del self.jobs[job_id]
+            self.cond.notify_all()
+
+    def complete(self, job: Dict[str, Any], summary: Optional[Dict[str, Any]] = None) -> None:
+        self._finish(job, "done", progress=summary or {})
+
+    def fail(self, job: Dict[str, Any], error: str, summary: Optional[Dict[str, Any]] = None) -> None:
+        self._finish(job, "failed", error_str=error, progress=summary or {})
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancels a queued job; running jobs cannot be cancelled."""
+        with self.cond:  # Reentrant, so no lane can start the job in between
+            job = self.jobs.get(job_id)
+            if job is None or job["state_str"] != "queued":
+                return False
+            self._finish(job, "cancelled")
+        return True
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Waits up to ``timeout`` seconds for a job to finish; returns its view, None if unknown."""
+        deadline = time.monotonic() + min(timeout, MAX_WAIT_SECONDS)
+        with self.cond:
+            while job_id in self.jobs and self.jobs[job_id]["state_str"] in ["queued", "running"]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+        return self.view(job_id)
+
+    def view(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job as shown by the API, with the progress so far while it runs."""
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            view = {k: v for k, v in job.items() if k != "payload"}
+        progress = self.progress.get(job_id)
+        if progress is not None:
+            view["progress"] = progress()
+        return view
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self.cond:
+            job_ids = list(self.jobs)
+        return [v for v in map(self.view, reversed(job_ids)) if v is not None]
+
+    def status(self) -> Dict[str, Any]:
+        with self.cond:
+            states: Dict[str, int] = {}
+            for job in self.jobs.values():
+                states[job["state_str"]] = states.get(job["state_str"], 0) + 1
+            running = [i for i, j in self.jobs.items() if j["state_str"] == "running"]
+        return {"uptime_seconds": round(time.time() - self.started), "jobs": states, "running": [self.view(i) for i in running]}
+
+    def stop(self) -> None:
+        """Lets the lanes return once their current job is done; queued jobs are dropped."""
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+
+class Scheduler:
+    """Recurring profile jobs, kept in a JSON file so they survive restarts.
+
+    A schedule submits its request every ``every_hours``; if the previous run
+    is still queued or running, that turn is skipped instead of piling up jobs.
+    """
+
+    def __init__(self, jobs: DaemonQueue, path: str, make_args: Callable[[Dict[str, Any]], argparse.Namespace]):
+        self.jobs = jobs
+        self.path = path
+        self.make_args = make_args
+        self.lock = threading.Lock()
+        self.schedules: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.schedules = json.load(f)
+            print(f"Loaded {len(self.schedules)} schedules from {path}.")
+
+    def _save(self) -> None:
+        temp = f"{self.path}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(self.schedules, f, indent=2)
+        os.replace(temp, self.path)
+
+    def add(self, name: str, every_hours: float, params: Dict[str, Any], start: Optional[str] = None) -> Dict[str, Any]:
+        """Adds or replaces a schedule; its first run is at ``start`` (ISO, UTC) or right away."""
+        if every_hours <= 0:
+            raise ValueError("every_hours must be positive")
+        self.make_args(params)  # Rejects invalid options now rather than at every run
+        schedule = {"every_hours": every_hours, "params": params, "next_utc_iso": start or datetime.utcnow().isoformat(), "last_job_str": None}
+        with self.lock:
+            self.schedules[name] = schedule
+            self._save()
+        return schedule
+
+    def remove(self, name: str) -> bool:
+        with self.lock:
+            if self.schedules.pop(name, None) is None:
+                return False
+            self._save()
+        return True
+
+    def list(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return json.loads(json.dumps(self.schedules))
+
+    def tick(self) -> None:
+        """Submits the schedules that are due."""
+        now = datetime.utcnow()
+        with self.lock:
+            due = False
+            for name, schedule in self.schedules.items():
+                next_run = datetime.fromisoformat(schedule["next_utc_iso"])
+                if next_run > now:
+                    continue
+                due = True
+                while next_run <= now:  # Runs missed while the daemon was down are not repeated
+                    next_run += timedelta(hours=schedule["every_hours"])
+                schedule["next_utc_iso"] = next_run.isoformat()
+                last = self.jobs.view(schedule["last_job_str"]) if schedule["last_job_str"] else None
+                if last is not None and last["state_str"] in ["queued", "running"]:
+                    print(f"Schedule {name}: previous run still {last['state_str']}, skipping this turn.")
+                    continue
+                try:
+                    job = self.jobs.submit(self.make_args(schedule["params"]), schedule["params"], SCHEDULE_PRIORITY, f"schedule:{name}")
+                except ValueError as e:
+                    print(f"Schedule {name}: {e}")
+                    continue
+                schedule["last_job_str"] = job["_id"]
+            if due:
+                self._save()
+
+    def run(self, stop: threading.Event) -> None:
+        while True:
+            self.tick()
+            if stop.wait(SCHEDULER_TICK_SECONDS):
+                return
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(listen: str, jobs: DaemonQueue, scheduler: Scheduler, make_args: Callable[[Dict[str, Any]], argparse.Namespace]) -> socketserver.BaseServer:
+    """Serves the job API on ``host:port`` or, with ``unix:<path>``, on a Unix socket, from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, body: Any, content_type: str = "application/json") -> None:
+            data = (body if isinstance(body, str) else json.dumps(body, default=str)).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _route(self) -> Tuple[List[str], Dict[str, str]]:
+            url = urlparse(self.path)
+            return [p for p in url.path.split("/") if p], {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        def _body(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("expected a JSON object")
+            return body
+
+        def _job(self, job_id: str, wait: float) -> None:
+            job = jobs.wait(job_id, wait) if wait else jobs.view(job_id)
+            if job is None:
+                self._send(404, {"error": f"unknown job {job_id}"})
+            else:
+                self._send(200 if job["state_str"] not in ["queued", "running"] else 202, job)
+
+        def do_GET(self) -> None:
+            path, query = self._route()
+            if path == ["status"]:
+                self._send(200, {**jobs.status(), "schedules": len(scheduler.list())})
+            elif path == ["jobs"]:
+                self._send(200, jobs.list())
+            elif len(path) == 2 and path[0] == "jobs":
+                self._job(path[1], float(query.get("wait", 0)))
+            elif path == ["schedules"]:
+                self._send(200, scheduler.list())
+            elif path == ["metrics"]:
+                self._send(200, metrics.render(), "text/plain; version=0.0.4; charset=utf-8")
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self) -> None:
+            path, query = self._route()
+            try:
+                body = self._body()
+                if path == ["jobs"]:
+                    wait = float(body.pop("wait", query.get("wait", 0)))
+                    priority = int(body.pop("priority", API_PRIORITY))
+                    job = jobs.submit(make_args(body), body, priority)
+                    print(f"Queued job {job['_id']}: {job['target_str']}")
+                    self._job(job["_id"], wait)
+                elif path == ["schedules"]:
+                    every_hours = float(body.pop("every_hours"))
+                    start = body.pop("start", None)
+                    name = body.pop("name", None) or str(body.get("profile", "")).lstrip("@")
+                    self._send(201, {name: scheduler.add(name, every_hours, body, start)})
+                else:
+                    self._send(404, {"error": "not found"})
+            except (ValueError, KeyError, TypeError) as e:
+                self._send(400, {"error": f"missing {e}" if isinstance(e, KeyError) else str(e)})
+
+        def do_DELETE(self) -> None:
+            path, _ = self._route()
+            if len(path) == 2 and path[0] == "jobs":
+                found = jobs.cancel(path[1])
+                self._send(200 if found else 409, {"cancelled": found})
+            elif len(path) == 2 and path[0] == "schedules":
+                found = scheduler.remove(path[1])
+                self._send(200 if found else 404, {"removed": found})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass  # Keep polling clients out of the scraper output
+
+    if listen.startswith("unix:"):
+        path = listen[len("unix:"):]
+        if os.path.exists(path):
+            os.remove(path)  # Left behind by a daemon that was killed
+        server: socketserver.BaseServer = UnixHTTPServer(path, Handler)
+        os.chmod(path, 0o600)
+    else:
+        host, port = listen.rsplit(":", 1)
+        server = ThreadingHTTPServer((host, int(port)), Handler)
+    threading.Thread(target=server.serve_forever, name="daemon-api", daemon=True).start()
+    print(f"Accepting jobs on {listen}.")
+    return server
+
+
+def parse_daemon_arguments() -> argparse.Namespace:
+    parser = build_parser()
+    parser.description = "Long-running scraper: keeps browsers and database connections open and takes scrape jobs over a local HTTP API."
+    parser.add_argument("--listen", type=str, default=LISTEN, help="host:port to serve the job API on, or unix:<path> for a Unix socket.")
+    parser.add_argument("--schedule-file", type=str, default=SCHEDULE_FILE, help="JSON file holding the recurring jobs.")
+    args = parser.parse_args()
+    if any(getattr(args, option) for option in STARTUP_EXCLUDED) or args.clear_checkpoints is not None:
+        parser.error("the daemon takes its profiles from API requests and schedules and has no --page-budget; the other options set the defaults of every request")
+    return args
+
+
+def run_lane(args: argparse.Namespace, jobs: DaemonQueue, lane: str, budget: PolitenessBudget) -> None:
+    """Runs the jobs of ``lane``; its samples are labeled with its own current profile."""
+    metrics.own_profile()
+    scrape_profiles(args, jobs.iter_jobs(lane), budget, jobs, True)
+
+
+def main() -> None:
+    args = parse_daemon_arguments()
+    metrics.configure(args.json_log, args.metrics_textfile, args.metrics_port)
+    jobs = DaemonQueue()
+    make_args = lambda params: request_args(args, params)
+    scheduler = Scheduler(jobs, args.schedule_file, make_args)
+    server = serve(args.listen, jobs, scheduler, make_args)
+    # Both lanes share one page budget; --initial-rate/--max-rate apply per lane
+    budget = PolitenessBudget(args.global_rate)
+    tweet_lane = threading.Thread(target=run_lane, args=(args, jobs, "tweet", budget), name="lane-tweet")
+    tweet_lane.start()
+    stop = threading.Event()
+    threading.Thread(target=scheduler.run, args=(stop,), name="scheduler", daemon=True).start()
+    try:
+        # In the main thread, so Ctrl+C and SIGTERM close the browsers and flush the writes
+        run_lane(args, jobs, "profile", budget)
+    except KeyboardInterrupt:
+        print("Stopping...")
+    finally:
+        stop.set()
+        jobs.stop()
+        server.shutdown()
+        tweet_lane.join()
+        if args.listen.startswith("unix:") and os.path.exists(args.listen[len("unix:"):]):
+            os.remove(args.listen[len("unix:"):])
+    print("Daemon stopped.")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,30 @@ import pymongo
 import os
 import hashlib
 from urllib.parse import urlparse
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import pymongo.collection
+import pymongo.database
+from pymongo.errors import OperationFailure
+from blob_store import BlobStore, GridFSBlobStore
+
+HIGH_WATER_ID_NAME = "high_water_mark_id_str"
+HIGH_WATER_DATETIME_NAME = "high_water_mark_datetime_utc_iso"
+
+# Fields identifying a document per collection; writes are upserts on them
+UNIQUE_KEYS = {
+    "tweets": ("username_str", "hash256_str"),
+    "comments": ("profile_tweet_id_str", "hash256_str"),
+    "profile": ("username_str",),
+    "attachments": ("ref_tweet_id_str", "quote_bool"),
+}
+# (keys, unique) per collection, created by ensure_indexes
+INDEXES = {
+    "tweets": [(UNIQUE_KEYS["tweets"], True), (("tweet_id_str",), False), (("username_str", "stats_updated_utc_iso"), False)],
+    "comments": [(UNIQUE_KEYS["comments"], True), (("tweet_id_str",), False)],
+    "profile": [(UNIQUE_KEYS["profile"], True)],
+    "attachments": [(("ref_tweet_id_str",), False)],
+    "checkpoints": [(("root_str",), False)],
+}
 
 
 def mongo_authenticate(path: str) -> pymongo.MongoClient:
@@ -45,14 +67,56 @@ def insert_one_tweet(col: pymongo.collection, doc: Dict[str, Any]):
     col.insert_one(doc)
 
 
+def upsert_one_tweet(col: pymongo.collection, doc: Dict[str, Any], keys: Tuple[str, ...]):
+    """Insert one document or update the one with the same key fields"""
+    col.update_one(unique_filter(doc, keys), {"$set": doc}, upsert=True)
+
+
+def unique_filter(doc: Dict[str, Any], keys: Tuple[str, ...]) -> Dict[str, Any]:
+    """Query matching the document with the same key fields (a missing key matches only where it is missing)"""
+    return {k: doc[k] if k in doc else {"$exists": False} for k in keys}
+
+
+def ensure_indexes(db: pymongo.database.Database) -> None:
+    """Create the indexes of all collections; existing ones are left untouched"""
+    for col_name, indexes in INDEXES.items():
+        for keys, unique in indexes:
+            name = "_".join(keys) + ("_unique" if unique else "")
+            try:
+                db[col_name].create_index([(k, pymongo.ASCENDING) for k in keys], name=name, unique=unique)
+            except OperationFailure as e:
+                if not unique:
+                    raise
+                # Documents stored before the index existed may be duplicates
+                print(f"Could not create unique index {name} on {col_name} ({e.details.get('codeName', e.code)}), creating a non-unique one. Remove the duplicates to enforce uniqueness.")
+                db[col_name].create_index([(k, pymongo.ASCENDING) for k in keys], name=name.replace("_unique", ""))
+
+
+def ensure_time_series(db: pymongo.database.Database, name: str, time_field: str, meta_field: str) -> None:
+    """Create a time-series collection unless it exists"""
+    if name not in db.list_collection_names(filter={"name": name}):
+        db.create_collection(name, timeseries={"timeField": time_field, "metaField": meta_field, "granularity": "hours"})
+
+
+def print_index_report(db: pymongo.database.Database) -> None:
+    """Print size and usage since the last server restart of every index"""
+    for col_name in INDEXES:
+        stats = next(db[col_name].aggregate([{"$collStats": {"storageStats": {}}}]), {}).get("storageStats", {})
+        print(f"{col_name}: {stats.get('count', 0)} documents, {stats.get('size', 0) / 1024 / 1024:.1f} MiB data, {stats.get('totalIndexSize', 0) / 1024 / 1024:.1f} MiB indexes")
+        sizes = stats.get("indexSizes", {})
+        for index in db[col_name].aggregate([{"$indexStats": {}}]):
+            accesses = index["accesses"]
+            print(f"  {index['name']:<40} {sizes.get(index['name'], 0) / 1024:>10.0f} KiB {accesses['ops']:>10} ops since {accesses['since']}")
+
+
 def get_tweet_by_id(col: pymongo.collection, id: str) -> Optional[Dict[str, Any]]:
     """Get a tweet by its ID"""
     return col.find_one({"id_str": id})
 
 
-def get_tweets_by_username(col: pymongo.collection, username: str) -> Optional[Dict[str, Any]]:
-    """Get tweets by username"""
-    return [i for i in col.find({"username_str": username})]
+def get_tweets_by_username(col: pymongo.collection, username: str) -> Iterator[Dict[str, Any]]:
+    """Stream tweets by username"""
+    return col.find({"username_str": username}, batch_size=10000)
 
 
 def get_tweet_by_username(col: pymongo.collection, username: str) -> Optional[Dict[str, Any]]:
@@ -60,6 +124,16 @@ def get_tweet_by_username(col: pymongo.collection, username: str) -> Optional[Di
     return col.find_one({"username_str": username})
 
 
+def get_high_water_mark(col: pymongo.collection, username: str) -> Optional[Dict[str, Any]]:
+    """Get the newest fully scraped tweet of a profile"""
+    return col.find_one({"username_str": username, HIGH_WATER_ID_NAME: {"$exists": True}}, {HIGH_WATER_ID_NAME: 1, HIGH_WATER_DATETIME_NAME: 1})
+
+
+def set_high_water_mark(col: pymongo.collection, username: str, tweet_id: str, datetime_utc_iso: str):
+    """Set the newest fully scraped tweet of a profile (on its existing profile document)"""
+    col.update_one({"username_str": username}, {"$set": {HIGH_WATER_ID_NAME: tweet_id, HIGH_WATER_DATETIME_NAME: datetime_utc_iso}})
+
+
 def get_all_tweets(col: pymongo.collection) -> List[Dict[str, Any]]:
     """Get all tweets in a collection"""
     return col.find({})
@@ -72,21 +146,34 @@ def get_hash_of_all_tweets(col_tweets: pymongo.collection, username: str = None)
     return [i["hash256_str"] for i in col_tweets.find({}, {"hash256_str": 1, "_id": 0})]
 
 
-def __extract_media(media_url: str, binary_data: bytes) -> None:
-    """Extract media from a from binary source"""
-    filename = os.path.join("./", extract_last_url_element(media_url))
-    # Write the binary data to file
-    with open(filename, "wb") as file:
-        file.write(binary_data)
-    print(f"Saved image file to {filename}")
+def iter_hashes(col: pymongo.collection, query: Dict[str, Any] = None) -> Iterator[str]:
+    """Stream the hashes of all documents matching a query"""
+    for i in col.find(query or {}, {"hash256_str": 1, "_id": 0}, batch_size=10000):
+        if "hash256_str" in i:
+            yield i["hash256_str"]
+
+
+def __extract_media(media: Dict[str, Any], store: BlobStore) -> None:
+    """Extract media from the blob store (or the legacy inline binary source)"""
+    filename = os.path.join("./", extract_last_url_element(media["media_url_str"]))
+    if "blob_sha256_str" in media:
+        # Streamed in chunks, large videos are never fully loaded into memory
+        store.copy_to(media["blob_sha256_str"], filename)
+    else:
+        # Write the binary data to file
+        with open(filename, "wb") as file:
+            file.write(media["binary_data_bytes"])
+    print(f"Saved media file to {filename}")
 
 
-def get_attachments(attachment_col: pymongo.collection, id: str) -> None:
-    """Get all attachments from a tweet"""
+def get_attachments(attachment_col: pymongo.collection, id: str, store: Optional[BlobStore] = None) -> None:
+    """Get all attachments from a tweet, from the GridFS blob store of the attachments' database unless ``store`` is given"""
     attachments = attachment_col.find_one({"ref_tweet_id_str": id})
     if attachments is not None:
+        if store is None:
+            store = GridFSBlobStore(attachment_col.database)
         for a in attachments["attachments_list"]:
-            __extract_media(a["media_url_str"], a["binary_data_bytes"])
+            __extract_media(a, store)
     else:
         print("Tweet not found.")
 
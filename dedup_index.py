@@ -0,0 +1,172 @@
+import sys
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+import pymongo.collection
+from database_wrapper import iter_hashes
+
+# Above this many stored hashes a scope switches from an exact set to a Bloom
+# filter whose positives are confirmed against the database.
+BLOOM_THRESHOLD = 1_000_000
+BLOOM_ERROR_RATE = 0.001
+BLOOM_HASHES = 10  # ~ -log2(BLOOM_ERROR_RATE)
+BLOOM_BITS_PER_ITEM = 15  # ~ -1.44 * log2(BLOOM_ERROR_RATE)
+HASH_FIELD = "hash256_str"
+SET_ENTRY_BYTES = sys.getsizeof("0" * 64) + 8  # str object plus set slot (approx.)
+CHECKED_CACHE_SIZE = 10_000  # Results of page lookups kept before the cache is emptied
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over hex SHA-256 digests."""
+
+    def __init__(self, capacity: int):
+        self.num_bits = max(8, capacity * BLOOM_BITS_PER_ITEM)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, hex_digest: str) -> Iterable[int]:
+        # The keys are already uniformly distributed SHA-256 digests, so slices
+        # of them serve as independent hash functions (double hashing).
+        h1 = int(hex_digest[:16], 16)
+        h2 = int(hex_digest[16:32], 16) | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(BLOOM_HASHES))
+
+    def add(self, hex_digest: str) -> None:
+        for pos in self._positions(hex_digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, hex_digest: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(hex_digest))
+
+
+class HashScope:
+    """Known tweet hashes for one profile or conversation.
+
+    By default nothing is downloaded: the hashes of a page not written during
+    this run are looked up in the collection with one query (``check``), which
+    the unique scope index answers without touching documents. With ``preload`` the stored hashes are streamed once
+    instead (fewer round trips to a distant database). Small preloaded scopes
+    are kept as an exact set. Once a scope grows beyond ``BLOOM_THRESHOLD`` it
+    is converted to a Bloom filter and every positive answer is confirmed with
+    a lookup, so membership stays exact while memory stays bounded.
+    """
+
+    def __init__(self, col: Optional[pymongo.collection.Collection] = None, query: Optional[Dict[str, Any]] = None, bloom_threshold: int = BLOOM_THRESHOLD, preload: bool = False):
+        self.col = col
+        self.query = query or {}
+        self.bloom_threshold = bloom_threshold
+        self.preload = preload
+        self.exact = set()
+        self.written = set()  # Hashes added during this run, possibly not flushed to MongoDB yet
+        self.loading = False
+        self.bloom: Optional[BloomFilter] = None
+        self.count = 0
+        self.db_lookups = 0
+        self.checked: Dict[str, bool] = {}  # Results of ``check``, by hash
+
+    @property
+    def lookup_only(self) -> bool:
+        return self.col is not None and not self.preload
+
+    def load(self) -> "HashScope":
+        """Stream the stored hashes of this scope from the database once (only with ``preload``)."""
+        if self.col is None or not self.preload:
+            return self
+        self.loading = True
+        for tweet_hash in iter_hashes(self.col, self.query):
+            self.add(tweet_hash)
+        self.loading = False
+        return self
+
+    def _to_bloom(self) -> None:
+        expected = self.count
+        if self.col is not None:
+            expected = max(expected, self.col.count_documents(self.query))
+        self.bloom = BloomFilter(int(expected * 1.5))
+        for tweet_hash in self.exact:
+            self.bloom.add(tweet_hash)
+        self.exact = set()
+
+    def add(self, tweet_hash: str) -> None:
+        if self.lookup_only:
+            self.written.add(tweet_hash)
+        elif self.bloom is not None:
+            self.bloom.add(tweet_hash)
+            if not self.loading:
+                self.written.add(tweet_hash)
+        else:
+            self.exact.add(tweet_hash)
+            if len(self.exact) > self.bloom_threshold:
+                self._to_bloom()
+        self.count += 1
+
+    def check(self, hashes: List[str]) -> None:
+        """Looks up the hashes of a page with one query, so testing them needs no further round trip."""
+        if self.col is None or not (self.lookup_only or self.bloom is not None):
+            return
+        unknown = [h for h in hashes if h not in self.written and h not in self.checked and (self.bloom is None or h in self.bloom)]
+        if not unknown:
+            return
+        self.db_lookups += 1
+        found = {d[HASH_FIELD] for d in self.col.find({**self.query, HASH_FIELD: {"$in": unknown}}, {"_id": 0, HASH_FIELD: 1})}
+        if len(self.checked) > CHECKED_CACHE_SIZE:
+            self.checked = {}
+        self.checked.update((h, h in found) for h in unknown)
+
+    def _in_database(self, tweet_hash: str) -> bool:
+        known = self.checked.get(tweet_hash)
+        if known is not None:
+            return known
+        self.db_lookups += 1
+        return self.col.find_one({**self.query, HASH_FIELD: tweet_hash}, {"_id": 0, HASH_FIELD: 1}) is not None
+
+    def __contains__(self, tweet_hash: str) -> bool:
+        if self.lookup_only:
+            return tweet_hash in self.written or self._in_database(tweet_hash)
+        if self.bloom is None:
+            return tweet_hash in self.exact
+        if tweet_hash not in self.bloom:
+            return False
+        if self.col is None or tweet_hash in self.written:
+            return True
+        return self._in_database(tweet_hash)
+
+    def memory_bytes(self) -> int:
+        written = sys.getsizeof(self.written) + len(self.written) * SET_ENTRY_BYTES
+        if self.bloom is not None:
+            return sys.getsizeof(self.bloom.bits) + written
+        return sys.getsizeof(self.exact) + len(self.exact) * SET_ENTRY_BYTES + written
+
+
+class DedupIndex:
+    """Run-wide registry of hash scopes, each loaded from MongoDB at most once."""
+
+    def __init__(self, bloom_threshold: int = BLOOM_THRESHOLD, preload: bool = False):
+        self.bloom_threshold = bloom_threshold
+        self.preload = preload
+        self.scopes: Dict[str, HashScope] = {}
+        self.lock = threading.Lock()  # Crawler threads may open the same scope concurrently
+
+    def scope(self, key: str, col: Optional[pymongo.collection.Collection] = None, query: Optional[Dict[str, Any]] = None) -> HashScope:
+        """Return the scope ``key``, loading it from ``col``/``query`` on first use.
+
+        Without a collection the scope starts empty and only tracks hashes
+        written during this run (used when rescraping is forced).
+        """
+        with self.lock:
+            if key not in self.scopes:
+                self.scopes[key] = HashScope(col, query, self.bloom_threshold, self.preload).load()
+            return self.scopes[key]
+
+    def profile_scope(self, col: pymongo.collection.Collection, username: str) -> HashScope:
+        return self.scope(f"{col.name}:profile:{username}", col, {"username_str": username})
+
+    def conversation_scope(self, col: pymongo.collection.Collection, profile_tweet: str) -> HashScope:
+        return self.scope(f"{col.name}:conversation:{profile_tweet}", col, {"profile_tweet_id_str": profile_tweet})
+
+    def report(self) -> None:
+        """Print the number of hashes and approximate memory held per scope."""
+        total = 0
+        for key, scope in self.scopes.items():
+            kind = "lookup" if scope.lookup_only else "bloom" if scope.bloom is not None else "set"
+            total += scope.memory_bytes()
+            print(f"Dedup index {key}: {scope.count} hashes ({kind}, {scope.memory_bytes() / 1024:.1f} KiB, {scope.db_lookups} DB lookups).")
+        print(f"Dedup index total: {len(self.scopes)} scopes, {total / 1024 / 1024:.2f} MiB.")
@@ -0,0 +1,185 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.webdriver import WebDriver
+from telemetry import metrics
+
+RECYCLE_PAGES = 500  # Pages per browser before it is replaced (0 to disable)
+RECYCLE_RSS_MB = 1500  # Browser memory (with its child processes) before it is replaced (0 to disable)
+RSS_CHECK_EVERY = 10  # Pages between memory measurements
+SPARE_AT = 0.8  # Fraction of a recycling limit at which a spare browser is started
+SPARES = 1
+
+
+def process_tree_rss(pid: int) -> Optional[int]:
+    """Resident memory in bytes of a process and all its descendants, None if it cannot be measured."""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            return sum(p.memory_info().rss for p in [root] + root.children(recursive=True))
+        except psutil.Error:
+            return None
+    if not os.path.exists(f"/proc/{pid}/statm"):
+        return None  # Neither psutil nor a Linux /proc
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/statm", "r") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+def browser_pid(driver: WebDriver) -> Optional[int]:
+    # undetected_chromedriver starts Chrome itself; plain Selenium's Chrome is a child of chromedriver
+    pid = getattr(driver, "browser_pid", None)
+    if pid is None and getattr(driver, "service", None) is not None and driver.service.process is not None:
+        pid = driver.service.process.pid
+    return pid
+
+
+def is_alive(driver: WebDriver) -> bool:
+    """Checks whether the WebDriver session still answers."""
+    try:
+        driver.execute_script("return 1")
+        return True
+    except WebDriverException:
+        return False
+
+
+class DriverPool:
+    """Starts, recycles and replaces the browsers of all browser fetchers of a run.
+
+    A browser is retired after ``recycle_pages`` pages or once it and its child
+    processes use more than ``recycle_rss_mb`` MiB. When a browser approaches
+    either limit a spare is started in the background, so the replacement is
+    usually ready when it is needed. Browsers are started one at a time and
+    retired ones are quit in the background.
+    """
+
+    def __init__(self, factory: Callable[[], WebDriver], spares: int = SPARES, recycle_pages: int = RECYCLE_PAGES, recycle_rss_mb: float = RECYCLE_RSS_MB):
+        self.factory = factory
+        self.spares = spares
+        self.recycle_pages = recycle_pages
+        self.recycle_rss = recycle_rss_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.start_lock = threading.Lock()  # undetected_chromedriver patches its binary on start
+        self.ready: List[WebDriver] = []
+        self.warming: List[Future] = []
+        self.background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="browser-pool")
+        self.started = 0
+        self.retired: Dict[str, int] = {}
+        self.last_rss: Optional[int] = None
+        self.peak_rss = 0
+        self.closed = False
+
+    def _start(self) -> WebDriver:
+        with self.start_lock, metrics.timer("driver_start"):
+            driver = self.factory()
+        with self.lock:
+            self.started += 1
+        return driver
+
+    def _warm(self) -> None:
+        driver = self._start()
+        with self.lock:
+            if not self.closed:
+                self.ready.append(driver)
+                return
+        self._quit(driver)
+
+    @staticmethod
+    def _quit(driver: WebDriver) -> None:
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Error closing browser: {e}")
+
+    def prepare(self) -> None:
+        """Starts a spare browser in the background unless enough are ready or starting."""
+        with self.lock:
+            self.warming = [f for f in self.warming if not f.done()]
+            if self.closed or len(self.ready) + len(self.warming) >= self.spares:
+                return
+            self.warming.append(self.background.submit(metrics.bind(self._warm)))
+
+    def acquire(self) -> WebDriver:
+        """Returns a ready spare, waiting for one that is starting, or starts a new browser."""
+        with self.lock:
+            pending = self.warming[0] if not self.ready and self.warming else None
+        if pending is not None:
+            try:
+                pending.result()
+            except Exception as e:
+                print(f"Starting a spare browser failed: {e}")
+        while True:
+            with self.lock:
+                driver = self.ready.pop() if self.ready else None
+            if driver is None:
+                return self._start()
+            if is_alive(driver):
+                return driver
+            self._quit(driver)
+
+    def retire(self, driver: WebDriver, reason: Optional[str] = None) -> None:
+        """Quits ``driver`` in the background; ``reason`` (pages, memory, crash) is counted."""
+        if reason is not None:
+            with self.lock:
+                self.retired[reason] = self.retired.get(reason, 0) + 1
+            metrics.inc("scraper_browser_restarts_total", reason=reason)
+            metrics.event("browser_retired", reason=reason, rss=self.last_rss)
+        self.background.submit(self._quit, driver)
+
+    def check(self, driver: WebDriver, pages: int) -> Optional[str]:
+        """Returns why ``driver`` should be recycled after its ``pages``-th page, if it should."""
+        if self.recycle_pages and pages >= self.recycle_pages:
+            return "pages"
+        near_limit = self.recycle_pages and pages >= SPARE_AT * self.recycle_pages
+        if pages % RSS_CHECK_EVERY == 0:
+            pid = browser_pid(driver)
+            rss = process_tree_rss(pid) if pid is not None else None
+            if rss is not None:
+                with self.lock:
+                    self.last_rss = rss
+                    self.peak_rss = max(self.peak_rss, rss)
+                metrics.set("scraper_browser_rss_bytes", rss)
+                if self.recycle_rss and rss >= self.recycle_rss:
+                    return "memory"
+                near_limit = near_limit or (self.recycle_rss and rss >= SPARE_AT * self.recycle_rss)
+        if near_limit:
+            self.prepare()
+        return None
+
+    def report(self) -> None:
+        retired = ", ".join(f"{n} {reason}" for reason, n in sorted(self.retired.items())) or "none"
+        rss = f"{self.last_rss / 1024 / 1024:.0f} MiB last, {self.peak_rss / 1024 / 1024:.0f} MiB peak" if self.last_rss is not None else "not measured"
+        print(f"Browsers: {self.started} started, replaced: {retired}; memory {rss}.")
+
+    def close(self) -> None:
+        """Quits the spares and waits until every retired browser is closed."""
+        with self.lock:
+            self.closed = True
+            spares, self.ready = self.ready, []
+        for driver in spares:
+            self.background.submit(self._quit, driver)
+        self.background.shutdown(wait=True)
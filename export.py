@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+from bson.objectid import ObjectId
+import pymongo.collection
+from database_wrapper import mongo_authenticate
+
+EXPORT_COLLECTIONS = ["tweets", "comments", "profile", "attachments"]
+BATCH_SIZE = 5000  # Documents per cursor batch and per Parquet row group
+ROWS_PER_FILE = 1_000_000
+STATE_FILE = "export_state.json"
+# Incremental exports stop this far before "now": client-generated ObjectIds of
+# buffered or concurrent writers may arrive slightly out of order.
+INCREMENTAL_MARGIN = timedelta(minutes=2)
+PROFILE_URL = "https://xcancel.com/{}/status/"
+
+
+def build_query(col_name: str, profiles: List[str], since: Optional[str], until: Optional[str], profile_tweet: Optional[str]) -> Dict[str, Any]:
+    """Filter of one collection; filters on fields a collection does not have are skipped."""
+    query: Dict[str, Any] = {}
+    if profiles and col_name in ["tweets", "profile"]:
+        query["username_str"] = {"$in": profiles}
+    if profiles and col_name == "comments":
+        query["profile_tweet_id_str"] = {"$in": [re.compile("^" + re.escape(PROFILE_URL.format(p))) for p in profiles]}
+    if (since or until) and col_name in ["tweets", "comments"]:
+        # ISO strings compare chronologically, so "2025-01" works as a bound, too
+        query["datetime_utc_iso"] = {**({"$gte": since} if since else {}), **({"$lt": until} if until else {})}
+    if profile_tweet and col_name == "comments":
+        if profile_tweet.isdigit():
+            query["profile_tweet_id_str"] = re.compile(f"/status/{profile_tweet}$")
+        else:
+            query["profile_tweet_id_str"] = profile_tweet
+    if profile_tweet and col_name == "tweets":
+        query["tweet_id_str"] = extract_status_id(profile_tweet)
+    return query
+
+
+def extract_status_id(value: str) -> str:
+    return value.rstrip("/").split("/")[-1]
+
+
+def iter_documents(col: pymongo.collection.Collection, query: Dict[str, Any], batch_size: int = BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """Streams the matching documents; attachment binaries of old documents are left out."""
+    projection = {"attachments_list.binary_data_bytes": 0} if col.name == "attachments" else None
+    with col.find(query, projection, batch_size=batch_size, no_cursor_timeout=True) as cursor:
+        for doc in cursor:
+            if col.name == "attachments":
+                # One row per media file
+                row = {"_id": doc["_id"], "ref_tweet_id_str": doc.get("ref_tweet_id_str"), "quote_bool": doc.get("quote_bool", False)}
+                media_list = doc.get("attachments_list", [])
+                if not isinstance(media_list, list):
+                    # Old documents hold a note such as "Too large to store in database." instead
+                    yield {**row, "attachments_list": media_list}
+                    continue
+                for media in media_list:
+                    yield {**row, **media} if isinstance(media, dict) else {**row, "attachments_list": media}
+            else:
+                yield doc
+
+
+def iter_batches(docs: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def to_json_value(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return None
+    return value
+
+
+class JsonlSink:
+    """Writes documents as JSON lines, one file per export run."""
+
+    extension = "jsonl"
+
+    def __init__(self, path: str):
+        self.path = f"{path}.{self.extension}"
+        self.file = open(self.path, "w", encoding="utf-8")
+        self.rows = 0
+
+    def write(self, batch: List[Dict[str, Any]]) -> None:
+        self.file.writelines(json.dumps({k: to_json_value(v) for k, v in doc.items()}, ensure_ascii=False, default=str) + "\n" for doc in batch)
+        self.rows += len(batch)
+
+    def close(self) -> List[str]:
+        self.file.close()
+        return [self.path]
+
+
+class ParquetSink:
+    """Writes documents as zstd-compressed Parquet, one row group per batch.
+
+    Column types follow the field name suffixes (``_int``, ``_bool``, ``_list``,
+    everything else as string), so every file of a collection has compatible
+    types. When a batch brings fields the current file does not have, or a file
+    reaches ``rows_per_file`` rows, the next part file is started with the
+    widened schema. Only one batch is held in memory at a time.
+    """
+
+    extension = "parquet"
+
+    def __init__(self, path: str, rows_per_file: int = ROWS_PER_FILE):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet export needs pyarrow: pip3 install pyarrow")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.rows_per_file = rows_per_file
+        self.fields: Dict[str, Any] = {}
+        self.writer = None
+        self.file_rows = 0
+        self.rows = 0
+        self.paths: List[str] = []
+
+    def arrow_type(self, name: str) -> Any:
+        if name.endswith("_int"):
+            return self.pa.int64()
+        if name.endswith("_bool"):
+            return self.pa.bool_()
+        if name.endswith("_list"):
+            return self.pa.list_(self.pa.string())
+        return self.pa.string()
+
+    @staticmethod
+    def convert(value: Any, name: str) -> Any:
+        if value is None:
+            return None
+        if name.endswith("_int") or name.endswith("_bool"):
+            return value
+        if name.endswith("_list"):
+            return [v if isinstance(v, str) else json.dumps(v, default=str) for v in (value if isinstance(value, list) else [value])]
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, default=str)
+        return str(to_json_value(value))
+
+    def _open(self) -> None:
+        schema = self.pa.schema([(name, type_) for name, type_ in self.fields.items()])
+        path = f"{self.path}-{len(self.paths):05d}.{self.extension}"
+        self.writer = self.pq.ParquetWriter(path, schema, compression="zstd")
+        self.paths.append(path)
+        self.file_rows = 0
+
+    def write(self, batch: List[Dict[str, Any]]) -> None:
+        new_fields = {name for doc in batch for name in doc} - self.fields.keys()
+        for name in sorted(new_fields):
+            self.fields[name] = self.arrow_type(name)
+        if self.writer is None or new_fields or self.file_rows >= self.rows_per_file:
+            if self.writer is not None:
+                self.writer.close()
+            self._open()
+        columns = {name: [self.convert(doc.get(name), name) for doc in batch] for name in self.fields}
+        self.writer.write_table(self.pa.table(columns, schema=self.writer.schema))
+        self.file_rows += len(batch)
+        self.rows += len(batch)
+
+    def close(self) -> List[str]:
+        if self.writer is not None:
+            self.writer.close()
+        return self.paths
+
+
+SINKS = {"jsonl": JsonlSink, "parquet": ParquetSink}
+
+
+def load_state(out_dir: str) -> Dict[str, Any]:
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(out_dir: str, state: Dict[str, Any]) -> None:
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def export_collection(col: pymongo.collection.Collection, query: Dict[str, Any], path: str, fmt: str, batch_size: int = BATCH_SIZE) -> int:
+    """Streams the documents of ``col`` matching ``query`` into ``path`` files; returns the number of rows."""
+    sink = SINKS[fmt](path)
+    try:
+        for batch in iter_batches(iter_documents(col, query, batch_size), batch_size):
+            sink.write(batch)
+    finally:
+        paths = sink.close()
+    print(f"Exported {sink.rows} rows of {col.name} to {', '.join(paths) if paths else 'nothing'}.")
+    return sink.rows
+
+
+def export(db: Any, out_dir: str, fmt: str, collections: List[str], profiles: List[str], since: Optional[str] = None, until: Optional[str] = None, profile_tweet: Optional[str] = None, incremental: bool = False, batch_size: int = BATCH_SIZE) -> None:
+    """Exports ``collections`` into ``out_dir``, with ``incremental`` only what was added since the last run.
+
+    Incremental runs remember, per collection and filter, the ObjectId bound of
+    the previous run in ``export_state.json`` and each writes new files, so
+    earlier exports stay untouched.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    state = load_state(out_dir)
+    run = datetime.utcnow()
+    upper = ObjectId.from_datetime(run - INCREMENTAL_MARGIN)
+    for col_name in collections:
+        query = build_query(col_name, profiles, since, until, profile_tweet)
+        key = json.dumps({"collection": col_name, "format": fmt, "profiles": sorted(profiles), "since": since, "until": until, "profile_tweet": profile_tweet}, sort_keys=True)
+        if incremental:
+            bounds = {"$lt": upper}
+            if key in state:
+                bounds["$gte"] = ObjectId(state[key]["exported_until_id"])
+            query["_id"] = bounds
+        col_dir = os.path.join(out_dir, col_name)
+        os.makedirs(col_dir, exist_ok=True)
+        export_collection(db[col_name], query, os.path.join(col_dir, f"{col_name}-{run.strftime('%Y%m%dT%H%M%S')}"), fmt, batch_size)
+        if incremental:
+            state[key] = {"exported_until_id": str(upper), "exported_utc_iso": run.isoformat()}
+            save_state(out_dir, state)
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Stream collections of xdb to Parquet or JSON lines.")
+    parser.add_argument("-o", "--out", type=str, default="./export", help="Output directory (one subdirectory per collection).")
+    parser.add_argument("--format", choices=list(SINKS), default="parquet", help="Output format.")
+    parser.add_argument("-c", "--collections", nargs="+", choices=EXPORT_COLLECTIONS, default=EXPORT_COLLECTIONS, help="Collections to export.")
+    parser.add_argument("-p", "--profile", action="append", default=[], help="Only this profile (repeatable): its tweets, profile document and comments.")
+    parser.add_argument("--since", type=str, default=None, help="Only tweets and comments posted at or after this ISO date/time (UTC).")
+    parser.add_argument("--until", type=str, default=None, help="Only tweets and comments posted before this ISO date/time (UTC).")
+    parser.add_argument("--profile-tweet", type=str, default=None, help="Only the comments of this profile tweet (status URL or ID) and the tweet itself.")
+    parser.add_argument("--incremental", action="store_true", help="Only documents added since the last incremental export with the same filters into this directory.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Cursor batch size and Parquet row group size.")
+    args = parser.parse_args()
+    args.profile = [p.lstrip("@") for p in args.profile]
+    return args
+
+
+def main() -> None:
+    args = parse_arguments()
+    db = mongo_authenticate("./")["xdb"]
+    export(db, args.out, args.format, args.collections, args.profile, args.since, args.until, args.profile_tweet, args.incremental, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
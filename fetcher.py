@@ -0,0 +1,374 @@
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.webdriver import WebDriver
+from selenium.webdriver.support.ui import WebDriverWait
+from driver_pool import DriverPool, is_alive
+from rate_limit import AdaptiveRateLimiter, PolitenessBudget
+from telemetry import metrics
+
+# Markup that only appears on pages Nitter rendered server-side. A 200 response
+# without any of them is most likely a JavaScript/bot challenge.
+NITTER_MARKERS = ("timeline-item", "class=\"timeline", "class=\"conversation", "profile-card", "error-panel", "main-tweet")
+BROWSER_ONLY_STATUS = (403, 503)
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+HTTP_TIMEOUT = 30
+HTTP_POOL_SIZE = 4
+# A browser page is ready once Nitter content, an error panel, pagination or a
+# rate-limit page is in the DOM; challenge pages get there after their redirect.
+READY_SELECTORS = ".timeline-item, .reply, .main-tweet, .profile-card, .error-panel, .show-more, .timeline-end, .timeline-none, .timeline-footer"
+READY_SCRIPT = f"return document.querySelector('{READY_SELECTORS}') !== null || (document.body !== null && document.body.innerText.includes('429 Too Many Requests'));"
+READY_TIMEOUT = 20.0
+READY_POLL = 0.25
+MAX_RESTARTS = 2  # Browser crashes tolerated per page before giving up
+
+
+class Page:
+    """HTML of a fetched page and how it was obtained."""
+
+    def __init__(self, url: str, html: str, status: int = 200, headers: Optional[Dict[str, str]] = None, backend: str = "browser", round_trips: int = 1):
+        self.url = url
+        self.html = html
+        self.status = status
+        self.headers = headers or {}
+        self.backend = backend
+        self.round_trips = round_trips  # WebDriver commands or HTTP requests spent on this page
+
+    @property
+    def rate_limited(self) -> bool:
+        return self.status == 429 or "429 Too Many Requests" in self.html
+
+
+class PageFetcher:
+    """Base class for page backends, tracking pages fetched and time spent.
+
+    Politeness is left to ``limiter`` (and the optional cross-process
+    ``budget``): every request first waits for a slot, and every response is
+    fed back so the limiter can speed up or back off.
+
+    ``prefetch`` loads a page on a background thread, so the wait for the next
+    slot and the download overlap with processing the current page; the next
+    ``get`` of that URL returns it. A prefetched page that is not asked for is
+    discarded by the next ``get``, which waits for it to finish first because
+    a fetcher loads one page at a time.
+    """
+
+    name = "base"
+
+    def __init__(self, limiter: AdaptiveRateLimiter, budget: Optional[PolitenessBudget] = None, prefetching: bool = True):
+        self.limiter = limiter
+        self.budget = budget
+        self.prefetching = prefetching
+        self.prefetched: Optional[Tuple[str, Future]] = None
+        self.prefetch_used = 0
+        self.prefetch_discarded = 0
+        self.pages = 0
+        self.seconds = 0.0
+        self.round_trips = 0
+
+    def _fetch(self, url: str) -> Page:
+        raise NotImplementedError
+
+    def _wait_for_slot(self) -> None:
+        with metrics.timer("rate_wait"):
+            self.limiter.acquire()
+            if self.budget is not None:
+                self.budget.acquire()
+
+    def _record(self, page: Page, seconds: float) -> None:
+        self.seconds += seconds
+        self.pages += 1
+        self.round_trips += page.round_trips
+        metrics.inc("scraper_pages_total", backend=page.backend)
+        metrics.inc("scraper_bytes_total", len(page.html), kind="page")
+        metrics.event("page", url=page.url, backend=page.backend, status=page.status, seconds=round(seconds, 3), bytes=len(page.html), round_trips=page.round_trips, rate_limited=page.rate_limited)
+
+    def _feedback(self, page: Page) -> None:
+        if page.rate_limited:
+            metrics.inc("scraper_rate_limited_total", backend=page.backend)
+            self.limiter.on_rate_limited(page.headers.get("Retry-After"))
+        else:
+            self.limiter.on_success()
+
+    def _get(self, url: str) -> Page:
+        self._wait_for_slot()
+        return self._fetch_in_slot(url)
+
+    def _fetch_in_slot(self, url: str) -> Page:
+        """Fetches ``url`` with a rate-limiter slot the caller already holds."""
+        start = time.monotonic()
+        page = self._fetch(url)
+        self._record(page, time.monotonic() - start)
+        self._feedback(page)
+        return page
+
+    def prefetch(self, url: str) -> None:
+        """Starts loading ``url`` in the background, unless prefetching is disabled."""
+        if not self.prefetching:
+            return
+        self.discard_prefetch()
+        future: Future = Future()
+
+        def load() -> None:
+            try:
+                future.set_result(self._get(url))
+            except BaseException as e:
+                future.set_exception(e)
+
+        self.prefetched = (url, future)
+        metrics.set("scraper_queue_depth", 1, stage="prefetch")
+        threading.Thread(target=metrics.bind(load), name="prefetch", daemon=True).start()
+
+    def discard_prefetch(self) -> None:
+        """Waits for a pending prefetch and drops its page."""
+        if self.prefetched is None:
+            return
+        url, future = self.prefetched
+        self.prefetched = None
+        metrics.set("scraper_queue_depth", 0, stage="prefetch")
+        self.prefetch_discarded += 1
+        metrics.inc("scraper_prefetch_total", result="discarded")
+        try:
+            future.result()
+        except Exception:
+            pass
+
+    def get(self, url: str) -> Page:
+        if self.prefetched is not None and self.prefetched[0] == url:
+            future = self.prefetched[1]
+            self.prefetched = None
+            metrics.set("scraper_queue_depth", 0, stage="prefetch")
+            self.prefetch_used += 1
+            metrics.inc("scraper_prefetch_total", result="used")
+            return future.result()
+        self.discard_prefetch()
+        return self._get(url)
+
+    def pages_fetched(self) -> int:
+        return self.pages
+
+    def save_debug(self, filename: str) -> None:
+        """Store whatever helps to debug the current page (screenshot or HTML)."""
+
+    def report(self) -> None:
+        rate = self.pages / self.seconds if self.seconds else 0.0
+        print(f"Fetch backend {self.name}: {self.pages} pages in {self.seconds:.1f}s ({rate:.3f} pages/sec, {self.round_trips} round trips).")
+        self.report_prefetch()
+
+    def report_prefetch(self) -> None:
+        if self.prefetch_used or self.prefetch_discarded:
+            print(f"Prefetched pages: {self.prefetch_used} used, {self.prefetch_discarded} discarded.")
+
+    def close(self) -> None:
+        pass
+
+
+class BrowserFetcher(PageFetcher):
+    """Fetches pages through an undetected Chrome taken from ``drivers`` on first use.
+
+    Instead of sleeping after a navigation, the DOM is polled until it holds
+    something the scraper can act on (``READY_SELECTORS``), at most
+    ``ready_timeout`` seconds. Politeness is entirely up to the rate limiter.
+    A crashed browser is replaced and the page loaded again; a browser that
+    reached the pool's page or memory limit is replaced between pages.
+    """
+
+    name = "browser"
+
+    def __init__(self, drivers: DriverPool, limiter: AdaptiveRateLimiter, budget: Optional[PolitenessBudget] = None, ready_timeout: float = READY_TIMEOUT, prefetching: bool = True):
+        super().__init__(limiter, budget, prefetching)
+        self.ready_timeout = ready_timeout
+        self.drivers = drivers
+        self.driver: Optional[WebDriver] = None
+        self.driver_pages = 0
+        self.timeouts = 0
+
+    def _wait_until_ready(self) -> int:
+        """Waits until the page is ready; returns the number of polls (WebDriver commands)."""
+        polls = 0
+
+        def ready(driver: WebDriver) -> bool:
+            nonlocal polls
+            polls += 1
+            return driver.execute_script(READY_SCRIPT)
+
+        with metrics.timer("ready_wait"):
+            try:
+                WebDriverWait(self.driver, self.ready_timeout, poll_frequency=READY_POLL).until(ready)
+            except TimeoutException:
+                self.timeouts += 1
+                print(f"Page not ready after {self.ready_timeout:.0f}s, reading it anyway.")
+        return polls
+
+    def _replace(self, reason: str) -> None:
+        self.drivers.retire(self.driver, reason)
+        self.driver = None
+        self.driver_pages = 0
+
+    def _load(self, url: str) -> Page:
+        if self.driver is None:
+            self.driver = self.drivers.acquire()
+        start = time.monotonic()
+        self.driver.get(url)  # Returns at DOMContentLoaded (eager page load strategy)
+        loading = time.monotonic() - start
+        polls = self._wait_until_ready()
+        start = time.monotonic()
+        # get, the readiness polls, current_url and page_source
+        page = Page(self.driver.current_url, self.driver.page_source, backend=self.name, round_trips=3 + polls)
+        metrics.observe("fetch", loading + time.monotonic() - start, backend=self.name)
+        return page
+
+    def _fetch(self, url: str) -> Page:
+        for attempt in range(MAX_RESTARTS + 1):
+            try:
+                page = self._load(url)
+                break
+            except WebDriverException as e:
+                if attempt == MAX_RESTARTS or self.driver is None or is_alive(self.driver):
+                    raise
+                print(f"Browser session lost ({e.__class__.__name__}), restarting it and loading the page again.")
+                self._replace("crash")
+        self.driver_pages += 1
+        reason = self.drivers.check(self.driver, self.driver_pages)
+        if reason is not None:
+            print(f"Recycling the browser after {self.driver_pages} pages ({reason} limit).")
+            self._replace(reason)
+        return page
+
+    def save_debug(self, filename: str) -> None:
+        if self.driver is not None:
+            self.driver.save_screenshot(f"{filename}.png")
+
+    def report(self) -> None:
+        super().report()
+        if self.timeouts:
+            print(f"Pages not ready within {self.ready_timeout:.0f}s: {self.timeouts}.")
+
+    def close(self) -> None:
+        if self.driver is not None:
+            self.drivers.retire(self.driver)
+            self.driver = None
+
+
+class HttpFetcher(PageFetcher):
+    """Fetches server-rendered Nitter pages over a pooled keep-alive session.
+
+    Pages that cannot be served without a real browser (challenge pages,
+    403/503 responses) are transparently fetched again through ``fallback``.
+    """
+
+    name = "http"
+
+    def __init__(self, fallback: BrowserFetcher, limiter: AdaptiveRateLimiter, budget: Optional[PolitenessBudget] = None, prefetching: bool = True):
+        super().__init__(limiter, budget, prefetching)
+        self.fallback = fallback
+        self.fallbacks = 0
+        self.last_html: Optional[str] = None
+        self.session = requests.Session()
+        self.session.headers.update(HTTP_HEADERS)
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @staticmethod
+    def needs_browser(response: requests.Response) -> bool:
+        if response.status_code in BROWSER_ONLY_STATUS:
+            return True
+        if response.status_code == 429:
+            return False
+        return not any(marker in response.text for marker in NITTER_MARKERS)
+
+    def _fetch(self, url: str) -> Optional[Page]:
+        with metrics.timer("fetch", backend=self.name):
+            response = self.session.get(url, timeout=HTTP_TIMEOUT)
+        self.last_html = response.text
+        if self.needs_browser(response):
+            return None
+        return Page(response.url, response.text, response.status_code, dict(response.headers), self.name)
+
+    def _get(self, url: str) -> Page:
+        self._wait_for_slot()
+        start = time.monotonic()
+        page = self._fetch(url)
+        if page is None:
+            print("Page needs a browser, falling back.")
+            self.fallbacks += 1
+            metrics.inc("scraper_browser_fallbacks_total")
+            return self.fallback._fetch_in_slot(url)  # Same slot, the HTTP attempt was not counted
+        self._record(page, time.monotonic() - start)
+        self._feedback(page)
+        return page
+
+    def pages_fetched(self) -> int:
+        return self.pages + self.fallback.pages
+
+    def save_debug(self, filename: str) -> None:
+        if self.last_html is not None:
+            with open(f"{filename}.html", "w", encoding="utf-8") as f:
+                f.write(self.last_html)
+        self.fallback.save_debug(filename)
+
+    def report(self) -> None:
+        super().report()
+        print(f"Pages that needed the browser: {self.fallbacks}.")
+        if self.fallback.pages:
+            self.fallback.report()
+
+    def close(self) -> None:
+        self.session.close()
+        self.fallback.close()
+
+
+class FetcherPool:
+    """Up to ``size`` fetchers shared by crawler threads, created on demand.
+
+    A fetcher (and its browser) is used by one thread at a time; idle ones are
+    handed out again, so a run never starts more than ``size`` browsers.
+    """
+
+    def __init__(self, factory: Callable[[], PageFetcher], size: int = 1):
+        self.factory = factory
+        self.size = max(1, size)
+        self.lock = threading.Lock()
+        self.available = threading.Condition(self.lock)
+        self.primary = factory()
+        self.fetchers: List[PageFetcher] = [self.primary]
+        self.idle: List[PageFetcher] = [self.primary]
+
+    @contextmanager
+    def acquire(self) -> Iterator[PageFetcher]:
+        with self.available:
+            while not self.idle and len(self.fetchers) >= self.size:
+                self.available.wait()
+            if self.idle:
+                fetcher = self.idle.pop()
+            else:
+                fetcher = self.factory()
+                self.fetchers.append(fetcher)
+        try:
+            yield fetcher
+        finally:
+            with self.available:
+                self.idle.append(fetcher)
+                self.available.notify()
+
+    def pages_fetched(self) -> int:
+        return sum(f.pages_fetched() for f in self.fetchers)
+
+    def report(self) -> None:
+        for fetcher in self.fetchers:
+            fetcher.report()
+
+    def close(self) -> None:
+        for fetcher in self.fetchers:
+            fetcher.discard_prefetch()
+            fetcher.close()
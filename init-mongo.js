@@ -2,4 +2,5 @@ db = new Mongo().getDB("xdb");
 db.createCollection('tweets', { capped: false });
 db.createCollection('comments', { capped: false });
 db.createCollection('attachments', { capped: false });
-db.createCollection('profile', { capped: false });
\ No newline at end of file
+db.createCollection('profile', { capped: false });
+db.createCollection('checkpoints', { capped: false });
\ No newline at end of file
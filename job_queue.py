@@ -0,0 +1,157 @@
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, Optional
+import pymongo
+import pymongo.collection
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Higher runs first: threads of a started profile are finished before new profiles are begun
+PRIORITY = {"profile": 0, "conversation": 10, "replies": 20}
+LEASE_SECONDS = 300
+HEARTBEAT_SECONDS = 60
+MAX_JOB_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 60  # Doubled with every failed attempt
+IDLE_POLL_SECONDS = 10
+
+
+class JobQueue:
+    """Scraping jobs in a MongoDB collection, shared by worker processes on any number of hosts.
+
+    A job is a profile timeline, a conversation or a thread of replies, with
+    ``_id`` ``<kind>:<target>`` so the same job is never queued twice. Workers
+    claim the queued job with the highest priority atomically and hold it for
+    ``lease_seconds``; a heartbeat renews the lease while it runs. If a worker
+    dies, its lease runs out and another worker takes the job over. A failed job
+    is retried after a growing delay, at most ``max_attempts`` times in total,
+    then it is marked failed.
+    """
+
+    def __init__(self, col: pymongo.collection.Collection, lease_seconds: int = LEASE_SECONDS, max_attempts: int = MAX_JOB_ATTEMPTS):
+        self.col = col
+        self.lease_duration = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def ensure_indexes(self) -> None:
+        self.col.create_index([("state_str", pymongo.ASCENDING), ("priority_int", pymongo.DESCENDING), ("not_before_utc_date", pymongo.ASCENDING)], name="claim")
+        self.col.create_index([("state_str", pymongo.ASCENDING), ("lease_until_utc_date", pymongo.ASCENDING)], name="expired_leases")
+
+    def enqueue(self, kind: str, target: str, profile: str, payload: Optional[Dict[str, Any]] = None, priority: Optional[int] = None, requeue: bool = False) -> bool:
+        """Queues a job unless it exists; with ``requeue`` a finished or failed one is queued again. Returns True if queued."""
+        now = datetime.utcnow()
+        job_id = f"{kind}:{target}"
+        state = {"state_str": "queued", "attempts_int": 0, "not_before_utc_date": now, "updated_utc_iso": now.isoformat()}
+        try:
+            self.col.insert_one({
+                "_id": job_id,
+                "kind_str": kind,
+                "target_str": target,
+                "profile_str": profile,
+                "payload": payload or {},
+                "priority_int": PRIORITY.get(kind, 0) if priority is None else priority,
+                "created_utc_iso": now.isoformat(),
+                **state,
+            })
+            return True
+        except DuplicateKeyError:
+            if not requeue:
+                return False
+        result = self.col.update_one({"_id": job_id, "state_str": {"$in": ["done", "failed"]}}, {"$set": {**state, "payload": payload or {}}, "$unset": {"error_str": ""}})
+        return result.modified_count > 0
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Leases the next job: queued and due, or leased by a worker whose lease ran out."""
+        while True:
+            now = datetime.utcnow()
+            job = self.col.find_one_and_update(
+                {"$or": [
+                    {"state_str": "queued", "not_before_utc_date": {"$lte": now}},
+                    {"state_str": "leased", "lease_until_utc_date": {"$lt": now}},
+                ]},
+                {"$set": {"state_str": "leased", "lease_owner_str": self.owner, "lease_until_utc_date": now + self.lease_duration, "updated_utc_iso": now.isoformat()}, "$inc": {"attempts_int": 1}},
+                sort=[("priority_int", pymongo.DESCENDING), ("not_before_utc_date", pymongo.ASCENDING)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None or job["attempts_int"] <= self.max_attempts:
+                return job
+            # Its workers kept dying before they could report a result
+            self._finish(job, "failed", error_str="lease expired too often")
+
+    def _owned(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        return {"_id": job["_id"], "state_str": "leased", "lease_owner_str": self.owner}
+
+    def heartbeat(self, job: Dict[str, Any], progress: Optional[Dict[str, Any]] = None) -> bool:
+        """Renews the lease, storing ``progress`` if given; False if another worker took the job over meanwhile."""
+        now = datetime.utcnow()
+        fields = {"lease_until_utc_date": now + self.lease_duration, "updated_utc_iso": now.isoformat()}
+        if progress is not None:
+            fields["progress"] = progress
+        result = self.col.update_one(self._owned(job), {"$set": fields})
+        return result.matched_count > 0
+
+    @contextmanager
+    def lease(self, job: Dict[str, Any], interval: float = HEARTBEAT_SECONDS, progress: Optional[Callable[[], Dict[str, Any]]] = None) -> Iterator[None]:
+        """Keeps the lease of ``job`` alive from a background thread while the block runs.
+
+        ``progress`` returns the pages, documents etc. of the job so far; it is
+        stored with every heartbeat.
+        """
+        stop = threading.Event()
+
+        def beat() -> None:
+            while not stop.wait(interval):
+                if not self.heartbeat(job, progress() if progress is not None else None):
+                    print(f"Lost the lease of job {job['_id']}, another worker may redo it.")
+                    return
+
+        thread = threading.Thread(target=beat, name="job-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def _finish(self, job: Dict[str, Any], state: str, **fields: Any) -> None:
+        now = datetime.utcnow()
+        self.col.update_one({"_id": job["_id"], "lease_owner_str": job.get("lease_owner_str", self.owner)}, {"$set": {"state_str": state, "updated_utc_iso": now.isoformat(), **fields}, "$unset": {"lease_until_utc_date": ""}})
+
+    def complete(self, job: Dict[str, Any], summary: Optional[Dict[str, Any]] = None) -> None:
+        self._finish(job, "done", progress=summary or {})
+
+    def fail(self, job: Dict[str, Any], error: str, summary: Optional[Dict[str, Any]] = None) -> None:
+        """Queues the job again after a delay, or marks it failed after the last attempt."""
+        if job["attempts_int"] >= self.max_attempts:
+            self._finish(job, "failed", error_str=error, progress=summary or {})
+            return
+        delay = RETRY_DELAY_SECONDS * 2 ** (job["attempts_int"] - 1)
+        self._finish(job, "queued", error_str=error, progress=summary or {}, not_before_utc_date=datetime.utcnow() + timedelta(seconds=delay))
+
+    def iter_jobs(self, drain: bool = False) -> Iterator[Dict[str, Any]]:
+        """Yields claimed jobs; waits for new ones when idle, or returns with ``drain``."""
+        while True:
+            job = self.claim()
+            if job is not None:
+                yield job
+            elif drain and self.col.count_documents({"state_str": {"$in": ["queued", "leased"]}}) == 0:
+                return
+            else:
+                time.sleep(IDLE_POLL_SECONDS)
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        counts: Dict[str, Dict[str, int]] = {}
+        for row in self.col.aggregate([{"$group": {"_id": {"kind": "$kind_str", "state": "$state_str"}, "n": {"$sum": 1}}}]):
+            counts.setdefault(row["_id"]["kind"], {})[row["_id"]["state"]] = row["n"]
+        return counts
+
+
+def print_jobs(jobs: JobQueue) -> None:
+    states = ["queued", "leased", "done", "failed"]
+    print(f"{'Kind':<14}" + "".join(f"{s:>10}" for s in states))
+    for kind, counts in sorted(jobs.counts().items()):
+        print(f"{kind:<14}" + "".join(f"{counts.get(s, 0):>10}" for s in states))
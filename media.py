@@ -0,0 +1,224 @@
+import hashlib
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from blob_store import BlobStore
+from database_wrapper import upsert_one_tweet, UNIQUE_KEYS
+from telemetry import metrics
+
+MEDIA_WORKERS = 8
+PER_HOST_LIMIT = 2
+MAX_PENDING = 64  # Queued downloads before attaching media blocks the parser
+DOWNLOAD_TIMEOUT = 60
+URL_CACHE_SIZE = 100_000  # Blob references kept around to serve repeated URLs within a run
+MAX_MEDIA_MB = 512  # Larger files are skipped (0 for no limit)
+DOWNLOAD_CHUNK = 256 * 1024
+SPOOL_SIZE = 1024 * 1024  # Files up to this size are buffered in memory, larger ones on disk
+MAX_RESUMES = 3  # Interrupted transfers continued with a Range request per file
+RESUMABLE_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.exceptions.Timeout)
+
+
+class MediaTooLarge(Exception):
+    pass
+
+
+def total_size(response: requests.Response) -> Optional[int]:
+    """Full size of the file from Content-Range (partial responses) or Content-Length."""
+    match = re.match(r"bytes \d+-\d+/(\d+)", response.headers.get("Content-Range", ""))
+    if match:
+        return int(match.group(1))
+    length = response.headers.get("Content-Length")
+    return int(length) if length and length.isdigit() else None
+
+
+class MediaDownloader:
+    """Downloads attachments in the background and stores them when complete.
+
+    Binaries go to a content-addressed ``BlobStore`` so each unique file is
+    stored once; attachment documents only reference them. All downloads
+    share one connection-pooled session and a bounded worker pool, with at most
+    ``per_host`` requests in flight per host. A URL requested again within the
+    run (e.g. a quote's media, which also appears on the quoting tweet) reuses
+    the pending or recent download instead of fetching it twice. At most
+    ``max_pending`` downloads are queued; beyond that ``attach`` blocks until
+    one finishes, so a fast parser cannot run away from the downloads.
+
+    Files are streamed in chunks into a temporary file and hashed on the fly,
+    so memory use does not depend on their size. Files larger than
+    ``max_media_mb`` are skipped, as early as their Content-Length allows, and
+    interrupted transfers are continued with Range requests.
+    """
+
+    def __init__(self, store: BlobStore, workers: int = MEDIA_WORKERS, per_host: int = PER_HOST_LIMIT, max_media_mb: float = MAX_MEDIA_MB, max_pending: int = MAX_PENDING):
+        self.store = store
+        self.per_host = per_host
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.pending = 0
+        self.max_bytes = int(max_media_mb * 1024 * 1024)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="media")
+        # Single writer so attachment documents are stored in submission order
+        self.sink = ThreadPoolExecutor(max_workers=1, thread_name_prefix="media-sink")
+        self.lock = threading.Lock()
+        self.host_slots: Dict[str, threading.Semaphore] = {}
+        self.downloads: "OrderedDict[str, Future]" = OrderedDict()
+        self.stored: List[Future] = []
+        self.files = 0
+        self.bytes = 0
+        self.failures = 0
+        self.too_large = 0
+        self.resumes = 0
+        self.deduplicated = 0
+        self.new_blobs = 0
+        self.started: Optional[float] = None
+
+    def _host_slot(self, url: str) -> threading.Semaphore:
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.Semaphore(self.per_host)
+            return self.host_slots[host]
+
+    def _check_size(self, size: Optional[int]) -> None:
+        if self.max_bytes and size is not None and size > self.max_bytes:
+            raise MediaTooLarge(f"{size / 1024 / 1024:.1f} MiB exceeds the limit of {self.max_bytes / 1024 / 1024:.0f} MiB")
+
+    def _stream(self, url: str, file: Any) -> Tuple[str, int, Optional[str]]:
+        """Streams ``url`` into ``file``; returns the SHA-256 hex digest, size and content type."""
+        sha256 = hashlib.sha256()
+        received = 0
+        resumes = 0
+        while True:
+            headers = {"Range": f"bytes={received}-"} if received else {}
+            with self.session.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                if received and response.status_code != 206:
+                    # The server ignored the range, start over
+                    file.seek(0)
+                    file.truncate()
+                    sha256 = hashlib.sha256()
+                    received = 0
+                size = total_size(response)
+                self._check_size(size)
+                try:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK):
+                        file.write(chunk)
+                        sha256.update(chunk)
+                        received += len(chunk)
+                        self._check_size(received)
+                    if size is None or received >= size:
+                        return sha256.hexdigest(), received, response.headers.get("Content-Type")
+                    error = f"connection closed after {received} of {size} bytes"
+                except RESUMABLE_ERRORS as e:
+                    error = e.__class__.__name__
+                if resumes >= MAX_RESUMES or response.headers.get("Accept-Ranges") != "bytes":
+                    raise requests.exceptions.ConnectionError(f"Download interrupted: {error}")
+                resumes += 1
+                with self.lock:
+                    self.resumes += 1
+                print(f"Download of {url} interrupted after {received / 1024 / 1024:.1f} MiB ({error}), resuming.")
+
+    def _download(self, url: str) -> Dict[str, Any]:
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as file:
+            with self._host_slot(url), metrics.timer("media_download"):
+                sha256, size, content_type = self._stream(url, file)
+            file.seek(0)
+            with metrics.timer("blob_store"):
+                is_new = self.store.put(sha256, file)
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+            self.new_blobs += is_new
+        metrics.inc("scraper_bytes_total", size, kind="media")
+        metrics.event("media", url=url, bytes=size, new_blob=is_new)
+        return {"media_url_str": url, "blob_sha256_str": sha256, "size_int": size, "content_type_str": content_type}
+
+    def _finished(self, future: Future) -> None:
+        self.slots.release()
+        with self.lock:
+            self.pending -= 1
+            pending = self.pending
+        metrics.set("scraper_queue_depth", pending, stage="media")
+
+    def fetch(self, url: str) -> Future:
+        """Returns a future for the blob reference of ``url``, downloading it at most once."""
+        with self.lock:
+            if url in self.downloads:
+                self.deduplicated += 1
+                self.downloads.move_to_end(url)
+                return self.downloads[url]
+        if not self.slots.acquire(blocking=False):
+            with metrics.timer("media_backpressure"):
+                self.slots.acquire()
+        with self.lock:
+            if url in self.downloads:  # Requested by another thread in the meantime
+                self.slots.release()
+                self.deduplicated += 1
+                return self.downloads[url]
+            if self.started is None:
+                self.started = time.monotonic()
+            future = self.pool.submit(metrics.bind(self._download), url)
+            self.pending += 1
+            pending = self.pending
+            self.downloads[url] = future
+            while len(self.downloads) > URL_CACHE_SIZE:
+                oldest_url, oldest = next(iter(self.downloads.items()))
+                if not oldest.done():
+                    break
+                del self.downloads[oldest_url]
+        metrics.set("scraper_queue_depth", pending, stage="media")
+        future.add_done_callback(self._finished)  # Runs right away if already done, so outside the lock
+        return future
+
+    def _store(self, attachments_con: Any, doc: Dict[str, Any], downloads: Dict[str, Future]) -> None:
+        media = []
+        for url, future in downloads.items():
+            try:
+                media.append(future.result())
+            except MediaTooLarge as e:
+                with self.lock:
+                    self.too_large += 1
+                metrics.inc("scraper_media_failures_total", reason="too_large")
+                metrics.event("media_failed", url=url, error=str(e))
+                print(f"Skipping {url}: {e}")
+            except Exception as e:
+                with self.lock:
+                    self.failures += 1
+                metrics.inc("scraper_media_failures_total", reason="error")
+                metrics.event("media_failed", url=url, error=str(e))
+                print(f"Error downloading {url}: {e}")
+        if media:
+            upsert_one_tweet(attachments_con, {**doc, "attachments_list": media}, UNIQUE_KEYS["attachments"])
+
+    def attach(self, attachments_con: Any, doc: Dict[str, Any], urls: List[str]) -> None:
+        """Downloads ``urls`` and inserts ``doc`` with their blob references once all are done."""
+        downloads = {url: self.fetch(url) for url in urls}
+        future = self.sink.submit(metrics.bind(self._store), attachments_con, doc, downloads)
+        with self.lock:
+            self.stored.append(future)
+            self.stored = [f for f in self.stored if not f.done()]
+
+    def report(self) -> None:
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        files_rate = self.files / elapsed if elapsed else 0.0
+        bytes_rate = self.bytes / elapsed if elapsed else 0.0
+        print(f"Media: {self.files} files, {self.bytes / 1024 / 1024:.1f} MiB in {elapsed:.1f}s ({files_rate:.2f} files/sec, {bytes_rate / 1024:.1f} KiB/sec), {self.deduplicated} duplicate URLs skipped, {self.new_blobs} new blobs stored, {self.resumes} resumed, {self.too_large} too large, {self.failures} failed.")
+
+    def close(self) -> None:
+        """Waits for all pending downloads and attachment writes."""
+        with self.lock:
+            pending = list(self.stored)
+        wait(pending)
+        self.sink.shutdown(wait=True)
+        self.pool.shutdown(wait=True)
+        self.session.close()
@@ -0,0 +1,102 @@
+import glob
+import gzip
+import json
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+from fetcher import Page
+
+ARCHIVE_FILE_MB = 1024  # A new archive file is started beyond this size
+INDEX_SUFFIX = ".index.jsonl"
+METADATA_HEADER = "X-Scraper-Metadata"
+
+
+class PageArchive:
+    """Append-only archive of the raw HTML of scraped pages.
+
+    Pages are written as WARC ``resource`` records, each compressed as its own
+    gzip member, so any record can be read by seeking to its offset and the
+    files open with standard WARC tools. Every archive file has a JSON-lines
+    index next to it with the URL, fetch time, offset and length of each record,
+    plus what the scraper knew about the page (timeline or conversation, the
+    profile tweet and reply depth). Each process writes its own files, so batch
+    workers and hosts can share one directory.
+    """
+
+    def __init__(self, directory: str, max_file_mb: float = ARCHIVE_FILE_MB):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_file_size = max_file_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.file: Optional[BinaryIO] = None
+        self.index = None
+        self.name = ""
+        self.parts = 0
+        self.records = 0
+        self.bytes = 0
+
+    def _open(self) -> None:
+        self.close()
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        self.name = f"pages-{socket.gethostname()}-{os.getpid()}-{stamp}-{self.parts:03d}.warc.gz"
+        self.parts += 1
+        self.file = open(os.path.join(self.directory, self.name), "ab")
+        self.index = open(os.path.join(self.directory, self.name + INDEX_SUFFIX), "a", encoding="utf-8")
+
+    def add(self, page: Page, **metadata: Any) -> None:
+        """Appends ``page`` with ``metadata``; the index line is written after the record."""
+        now = datetime.utcnow()
+        body = page.html.encode("utf-8")
+        headers = [
+            "WARC/1.0",
+            "WARC-Type: resource",
+            f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>",
+            f"WARC-Date: {now.strftime('%Y-%m-%dT%H:%M:%SZ')}",
+            f"WARC-Target-URI: {page.url}",
+            "Content-Type: text/html; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            f"{METADATA_HEADER}: {json.dumps(metadata)}",
+        ]
+        record = gzip.compress("\r\n".join(headers).encode("utf-8") + b"\r\n\r\n" + body + b"\r\n\r\n")
+        with self.lock:
+            if self.file is None or self.file.tell() + len(record) > self.max_file_size:
+                self._open()
+            offset = self.file.tell()
+            self.file.write(record)
+            self.file.flush()
+            self.index.write(json.dumps({"url": page.url, "time": now.isoformat(), "file": self.name, "offset": offset, "length": len(record), **metadata}) + "\n")
+            self.index.flush()
+            self.records += 1
+            self.bytes += len(record)
+
+    def report(self) -> None:
+        print(f"Page archive: {self.records} pages, {self.bytes / 1024 / 1024:.1f} MiB compressed in {self.parts} files.")
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.index.close()
+            self.file = None
+
+
+def read_index(directory: str) -> Iterator[Dict[str, Any]]:
+    """All index entries of the archive in ``directory``; lines of records cut off by a crash are skipped."""
+    for path in sorted(glob.glob(os.path.join(directory, "*" + INDEX_SUFFIX))):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def read_record(file: BinaryIO, entry: Dict[str, Any]) -> Tuple[Dict[str, str], str]:
+    """Reads the record of an index entry from its open archive file; returns the WARC headers and the HTML."""
+    file.seek(entry["offset"])
+    record = gzip.decompress(file.read(entry["length"]))
+    head, body = record.split(b"\r\n\r\n", 1)
+    headers = dict(line.split(": ", 1) for line in head.decode("utf-8").split("\r\n")[1:])
+    return headers, body[:int(headers["Content-Length"])].decode("utf-8")
@@ -0,0 +1,160 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from fetcher import NITTER_MARKERS, Page, PageFetcher
+from telemetry import metrics
+
+CACHE_FILE = "pages.sqlite3"
+TTL_HOURS = {"status": 12.0, "timeline": 0.0}  # 0 disables caching of a page type
+MAX_SIZE_MB = 2048
+EVICT_TO = 0.9  # Eviction stops at this fraction of the size limit
+COMPRESSION_LEVEL = 6
+
+
+def normalize_url(url: str) -> str:
+    """Cache key of ``url``: lower-case host and path, no fragment or trailing slash, sorted query."""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit(("https", parts.netloc.lower(), parts.path.rstrip("/").lower(), query, ""))
+
+
+def page_type(url: str) -> str:
+    return "status" if "/status/" in urlsplit(url).path else "timeline"
+
+
+class PageCache:
+    """Compressed HTML of fetched pages on disk, with a TTL per page type and LRU eviction.
+
+    Pages are stored zlib-compressed in one SQLite file in ``directory``, keyed
+    by the normalized URL (the "Load more" cursor is part of the query). The
+    file can be shared by batch worker processes. Once the stored pages exceed
+    ``max_size_mb``, the least recently used ones are deleted.
+    """
+
+    def __init__(self, directory: str, ttl_hours: Optional[Dict[str, float]] = None, max_size_mb: float = MAX_SIZE_MB):
+        os.makedirs(directory, exist_ok=True)
+        self.ttl = {kind: hours * 3600 for kind, hours in {**TTL_HOURS, **(ttl_hours or {})}.items()}
+        self.max_size = max_size_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(directory, CACHE_FILE), timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, url TEXT, kind TEXT, html BLOB, size INTEGER, stored REAL, accessed REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed)")
+        self.db.commit()
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def enabled(self, url: str) -> bool:
+        return self.ttl.get(page_type(url), 0) > 0
+
+    def get(self, url: str) -> Optional[Page]:
+        """The cached page of ``url`` if it is younger than the TTL of its type."""
+        key = normalize_url(url)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT url, html, stored FROM pages WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                result = "miss"
+            elif now - row[2] > self.ttl.get(page_type(url), 0):
+                self.expired += 1
+                result = "expired"
+            else:
+                self.hits += 1
+                result = "hit"
+                self.db.execute("UPDATE pages SET accessed = ? WHERE key = ?", (now, key))
+                self.db.commit()
+        metrics.inc("scraper_cache_lookups_total", result=result)
+        if result != "hit":
+            return None
+        return Page(row[0], zlib.decompress(row[1]).decode("utf-8"), backend="cache", round_trips=0)
+
+    def put(self, url: str, page: Page) -> None:
+        key = normalize_url(url)
+        html = zlib.compress(page.html.encode("utf-8"), COMPRESSION_LEVEL)
+        now = time.time()
+        with self.lock:
+            old = self.db.execute("SELECT size FROM pages WHERE key = ?", (key,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)", (key, page.url, page_type(url), html, len(html), now, now))
+            self.db.commit()
+            self.size += len(html) - (old[0] if old else 0)
+            if self.size > self.max_size:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Other processes write to the same file, so the size is recounted first
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        target = self.max_size * EVICT_TO
+        deleted = []
+        for key, size in self.db.execute("SELECT key, size FROM pages ORDER BY accessed"):
+            if self.size <= target:
+                break
+            deleted.append((key,))
+            self.size -= size
+        self.db.executemany("DELETE FROM pages WHERE key = ?", deleted)
+        self.db.commit()
+        self.evicted += len(deleted)
+
+    def report(self) -> None:
+        lookups = self.hits + self.misses + self.expired
+        rate = self.hits / lookups * 100 if lookups else 0.0
+        print(f"Page cache: {self.hits} hits, {self.misses} misses, {self.expired} expired ({rate:.0f}% hit rate), {self.evicted} evicted, {self.size / 1024 / 1024:.1f} MiB stored.")
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
+
+
+class CachingFetcher(PageFetcher):
+    """Serves pages from ``cache`` and fetches (and stores) the others through ``fetcher``.
+
+    Cache hits skip the rate limiter and the network. Only complete Nitter
+    pages are stored: no rate limits, error panels or challenge pages.
+    """
+
+    name = "cache"
+
+    def __init__(self, fetcher: PageFetcher, cache: PageCache):
+        super().__init__(fetcher.limiter, fetcher.budget, fetcher.prefetching)
+        self.fetcher = fetcher
+        self.cache = cache
+
+    @staticmethod
+    def cacheable(page: Page) -> bool:
+        if page.status != 200 or page.rate_limited or "error-panel" in page.html:
+            return False
+        return any(marker in page.html for marker in NITTER_MARKERS)
+
+    def _get(self, url: str) -> Page:
+        if not self.cache.enabled(url):
+            return self.fetcher.get(url)
+        page = self.cache.get(url)
+        if page is not None:
+            self.pages += 1
+            metrics.event("page", url=page.url, backend=self.name, status=page.status, bytes=len(page.html))
+            return page
+        page = self.fetcher.get(url)
+        if self.cacheable(page):
+            self.cache.put(url, page)
+        return page
+
+    def pages_fetched(self) -> int:
+        return self.fetcher.pages_fetched()
+
+    def save_debug(self, filename: str) -> None:
+        self.fetcher.save_debug(filename)
+
+    def report(self) -> None:
+        self.fetcher.report()
+        print(f"Pages served from the cache: {self.pages}.")
+        self.report_prefetch()
+
+    def close(self) -> None:
+        self.fetcher.close()
@@ -0,0 +1,125 @@
+import multiprocessing
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from time import sleep
+from typing import Optional
+
+# Adaptive rate limiter, all rates in pages per minute
+INITIAL_RATE = 3.0  # roughly the former fixed 15 s + 2-4 s per page
+MIN_RATE = 0.5
+MAX_RATE = 30.0
+RATE_INCREASE = 0.25  # per successful page
+RATE_DECREASE = 0.5  # factor per rate-limited page
+BACKOFF_BASE = 30.0  # seconds, doubled per consecutive rate limit
+BACKOFF_MAX = 900.0
+BACKOFF_JITTER = 0.25
+LOG_EVERY = 10  # pages between effective rate log lines
+
+
+class PolitenessBudget:
+    """Global page budget shared by all worker processes of a batch run.
+
+    Hands out fetch slots at most ``pages_per_minute`` apart across processes,
+    so adding workers increases throughput only up to the configured rate.
+    It also counts the pages handed out; once ``max_pages`` are reached
+    (0 for no limit) the run is ``exhausted`` and starts nothing new.
+    """
+
+    def __init__(self, pages_per_minute: float, max_pages: int = 0):
+        self.interval = 60.0 / pages_per_minute if pages_per_minute > 0 else 0.0
+        self.max_pages = max_pages
+        self.lock = multiprocessing.Lock()
+        self.next_slot = multiprocessing.Value("d", 0.0, lock=False)
+        self.pages = multiprocessing.Value("q", 0, lock=False)
+
+    def exhausted(self) -> bool:
+        return self.max_pages > 0 and self.pages.value >= self.max_pages
+
+    def acquire(self) -> float:
+        """Blocks until this process may fetch its next page; returns the time waited."""
+        with self.lock:
+            self.pages.value += 1
+            if self.interval == 0.0:
+                return 0.0
+            now = time.time()
+            slot = max(now, self.next_slot.value)
+            self.next_slot.value = slot + self.interval
+        wait = slot - now
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose rate adapts to the upstream (AIMD).
+
+    Every successful page raises the rate additively up to ``max_rate``; a
+    rate-limited page halves it and pushes the next request back by an
+    exponential, jittered backoff, or by ``Retry-After`` when the server sent
+    one. Rates are in pages per minute.
+    """
+
+    def __init__(self, initial_rate: float = INITIAL_RATE, max_rate: float = MAX_RATE, min_rate: float = MIN_RATE):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = min(max(initial_rate, self.min_rate), max_rate)
+        self.lock = threading.Lock()
+        self.next_request = 0.0
+        self.consecutive_limits = 0
+        self.successes = 0
+        self.rate_limits = 0
+        self.waited = 0.0
+
+    def acquire(self) -> float:
+        """Blocks until the next request is allowed; returns the time waited."""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_request)
+            self.next_request = slot + 60.0 / self.rate
+        wait = slot - now
+        if wait > 0:
+            sleep(wait)
+            self.waited += wait
+        return wait
+
+    def on_success(self) -> None:
+        with self.lock:
+            self.consecutive_limits = 0
+            self.successes += 1
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+            if self.successes % LOG_EVERY == 0:
+                print(f"Effective rate: {self.rate:.2f} pages/min.")
+
+    def on_rate_limited(self, retry_after: Optional[str] = None) -> float:
+        """Slows down after a 429 (or a page that looks like one); returns the backoff in seconds."""
+        with self.lock:
+            self.consecutive_limits += 1
+            self.rate_limits += 1
+            self.rate = max(self.min_rate, self.rate * RATE_DECREASE)
+            backoff = parse_retry_after(retry_after)
+            if backoff is None:
+                backoff = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.consecutive_limits - 1))
+                backoff *= random.uniform(1 - BACKOFF_JITTER, 1 + BACKOFF_JITTER)
+            self.next_request = max(self.next_request, time.monotonic() + backoff)
+        print(f"Rate limited, backing off {backoff:.0f}s; effective rate now {self.rate:.2f} pages/min.")
+        return backoff
+
+    def report(self) -> None:
+        print(f"Rate limiter: {self.rate:.2f} pages/min at end, {self.successes} pages ok, {self.rate_limits} rate limited, {self.waited:.0f}s waited.")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parses a ``Retry-After`` header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,186 @@
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from bs4 import BeautifulSoup
+from bulk_writer import BulkWriter
+from database_wrapper import mongo_authenticate, ensure_indexes, unique_filter, UNIQUE_KEYS
+from dedup_index import HashScope
+from page_archive import read_index, read_record
+from scraper import (
+    parse_tweet,
+    scrape_profile_info,
+    COMMENTS_DB,
+    DATETIME_NAME,
+    PROFILE_DB,
+    PROFILE_TWEET_ID_NAME,
+    STATS_LEGEND,
+    TWEET_ID_NAME,
+    TWEETS_DB,
+)
+
+RECORDS_PER_TASK = 100
+WAITING_TIME_DAYS = 7
+
+
+def profile_of(entry: Dict[str, Any]) -> str:
+    """Username of the profile an archived page was scraped for."""
+    return urlparse(entry.get("profile_tweet") or entry["thread_url"]).path.split("/")[1]
+
+
+def page_kind(entry: Dict[str, Any]) -> str:
+    """``timeline``, ``status`` (the tweet of a ``-t`` run) or ``conversation``."""
+    if entry["kind"] == "timeline" and "/status/" in entry["thread_url"]:
+        return "status"  # Archived before status pages had a kind of their own
+    return entry["kind"]
+
+
+def parse_archived_page(html: str, entry: Dict[str, Any], waiting_time_days: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """Parses an archived page the way ``scrape_tweets`` did; returns (collection, document) pairs.
+
+    Every tweet on the page is returned, also those the scraper skipped as
+    already known. Timeline tweets younger than ``waiting_time_days`` at the
+    time the page was fetched are left out, like in the original run. Of a
+    status page only the tweet itself is returned, its replies are stored
+    from the conversation pages. Attachments are not downloaded again.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    fetched = datetime.fromisoformat(entry["time"])
+    kind = page_kind(entry)
+    is_profile = kind != "conversation"
+    docs: List[Tuple[str, Dict[str, Any]]] = []
+    profile_info: Optional[Dict[str, Any]] = None
+    if is_profile:
+        card = soup.find(class_="profile-card")
+        if card is not None:
+            profile_info = scrape_profile_info(card)
+            if profile_info:
+                docs.append((PROFILE_DB, profile_info))
+        if not profile_info:
+            profile_info = {"username_str": profile_of(entry), "fullname_str": None}
+
+    if kind == "status":
+        tweets = soup.select(".main-tweet .timeline-item")[:1]
+    else:
+        tweets = soup.find_all(class_="timeline-item" if is_profile else "reply")
+    for tweet in tweets:
+        tweet_soup = tweet.find("div")
+        if tweet_soup is None:
+            continue
+        data = parse_tweet(tweet_soup, HashScope(), None, is_profile, 0, False, profile_info, page_url=entry["url"])
+        if not isinstance(data, dict):
+            continue
+        if kind == "timeline" and fetched - datetime.fromisoformat(data[DATETIME_NAME]) <= timedelta(days=waiting_time_days):
+            continue
+        if not is_profile:
+            data.update({TWEET_ID_NAME: entry["thread_url"], PROFILE_TWEET_ID_NAME: entry["profile_tweet"], "depth_int": entry["depth"]})
+        docs.append((TWEETS_DB if is_profile else COMMENTS_DB, data))
+    return docs
+
+
+def parse_records(task: Tuple[str, List[Dict[str, Any]], int]) -> Tuple[List[Tuple[str, Dict[str, Any]]], int]:
+    """Process pool task: parses a chunk of archive records; returns the documents and the number of failed records."""
+    directory, entries, waiting_time_days = task
+    docs: List[Tuple[str, Dict[str, Any]]] = []
+    failed = 0
+    files: Dict[str, Any] = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):  # parser progress messages
+            for entry in entries:
+                try:
+                    if entry["file"] not in files:
+                        files[entry["file"]] = open(os.path.join(directory, entry["file"]), "rb")
+                    _, html = read_record(files[entry["file"]], entry)
+                    docs.extend(parse_archived_page(html, entry, waiting_time_days))
+                except Exception:
+                    failed += 1
+    finally:
+        for f in files.values():
+            f.close()
+    return docs, failed
+
+
+def store(writer: BulkWriter, db: Any, col_name: str, doc: Dict[str, Any]) -> None:
+    """Upserts a re-parsed document; stats of tweets and comments are only set on new documents.
+
+    Archived stats are older than the ones a stats refresh may have stored since.
+    """
+    doc = {k: v for k, v in doc.items() if v is not None}
+    update: Dict[str, Any] = {"$set": doc}
+    if col_name in [TWEETS_DB, COMMENTS_DB]:
+        stats = {k: doc.pop(k) for k in STATS_LEGEND if k in doc}
+        if stats:
+            update["$setOnInsert"] = stats
+    writer.update(db[col_name], unique_filter(doc, UNIQUE_KEYS[col_name]), update, upsert=True)
+
+
+def select_entries(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    entries = []
+    for entry in read_index(args.archive):
+        if args.kind and page_kind(entry) != args.kind:
+            continue
+        if args.since and entry["time"] < args.since:
+            continue
+        if args.until and entry["time"] >= args.until:
+            continue
+        if args.profile and profile_of(entry) not in args.profile:
+            continue
+        entries.append(entry)
+    # Oldest first, so the newest copy of a tweet is the one that stays
+    return sorted(entries, key=lambda e: e["time"])
+
+
+def reparse(args: argparse.Namespace) -> None:
+    entries = select_entries(args)
+    tasks = [(args.archive, entries[i:i + RECORDS_PER_TASK], args.waiting_time) for i in range(0, len(entries), RECORDS_PER_TASK)]
+    print(f"Re-parsing {len(entries)} archived pages with {args.workers} processes...")
+    start = time.monotonic()
+    writer = None
+    db = None
+    if not args.dry_run:
+        db = mongo_authenticate("./")["xdb"]
+        ensure_indexes(db)
+        writer = BulkWriter()
+    counts: Dict[str, int] = {}
+    failed = 0
+    with multiprocessing.Pool(args.workers) as pool:
+        # imap keeps the chronological order of the results
+        for docs, task_failed in pool.imap(parse_records, tasks):
+            failed += task_failed
+            for col_name, doc in docs:
+                counts[col_name] = counts.get(col_name, 0) + 1
+                if writer is not None:
+                    store(writer, db, col_name, doc)
+    if writer is not None:
+        writer.close()
+        writer.report()
+    parsed = ", ".join(f"{n} {col_name}" for col_name, n in sorted(counts.items())) or "nothing"
+    print(f"Parsed {parsed} from {len(entries) - failed} pages in {time.monotonic() - start:.1f}s, {failed} pages failed.")
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Parse pages archived with scraper.py --archive again and upsert the results into xdb.")
+    parser.add_argument("-a", "--archive", type=str, default="./archive", help="Archive directory.")
+    parser.add_argument("-p", "--profile", action="append", default=[], help="Only pages scraped for this profile (repeatable).")
+    parser.add_argument("--kind", choices=["timeline", "status", "conversation"], default=None, help="Only timeline, status (-t) or conversation pages.")
+    parser.add_argument("--since", type=str, default=None, help="Only pages fetched at or after this ISO date/time (UTC).")
+    parser.add_argument("--until", type=str, default=None, help="Only pages fetched before this ISO date/time (UTC).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parser processes.")
+    parser.add_argument("--waiting-time", type=int, default=WAITING_TIME_DAYS, help="Skip timeline tweets that were younger than this many days when their page was fetched.")
+    parser.add_argument("--dry-run", action="store_true", help="Only parse and count, write nothing.")
+    args = parser.parse_args()
+    args.profile = [p.lstrip("@") for p in args.profile]
+    return args
+
+
+def main() -> None:
+    reparse(parse_arguments())
+
+
+if __name__ == '__main__':
+    main()
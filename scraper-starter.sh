@@ -1,6 +1,7 @@
 #!/bin/bash
 
 # Add this to your crontab 0 23 * * 0 /bin/bash $HOME/x_scraper/scraper-starter.sh
+# Alternatively keep daemon.py running with a weekly schedule (see README)
 
 cd $HOME/x_scraper
 filename=scraper-log.txt
@@ -13,4 +14,6 @@ fi
 source .env/bin/activate
 echo $(date +'%Y-%m-%d') >> $filename
 python3 scraper.py -p @doge --max-comments 9999 --max-tweets 9999 --deep >> $filename
+# Or scrape many accounts in parallel:
+# python3 scraper.py --profiles-file profiles.txt --workers 4 --max-comments 9999 --max-tweets 9999 --deep >> $filename
 deactivate
\ No newline at end of file
@@ -1,24 +1,46 @@
 import undetected_chromedriver as uc
-from selenium.webdriver.common.by import By
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from datetime import datetime, timedelta
-import requests
 import re
-from typing import Any, Dict, List, Optional, Union
+import math
+import heapq
+import itertools
+from urllib.parse import urljoin
+from typing import Any, Dict, List, Optional, Tuple, Union
 import argparse
-import random
-from time import sleep
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import multiprocessing
+import queue
+import time
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.chrome.webdriver import WebDriver
-from pymongo.errors import DocumentTooLarge, WriteError
 from database_wrapper import (
     mongo_authenticate,
-    insert_one_tweet,
-    get_hash_of_all_tweets,
+    upsert_one_tweet,
     extract_last_url_element,
     hash_object,
-    get_tweet_by_username
+    get_tweet_by_username,
+    get_high_water_mark,
+    set_high_water_mark,
+    ensure_indexes,
+    ensure_time_series,
+    print_index_report,
+    HIGH_WATER_ID_NAME,
+    UNIQUE_KEYS
 )
+from dedup_index import DedupIndex, HashScope
+from driver_pool import DriverPool, RECYCLE_PAGES, RECYCLE_RSS_MB, SPARES
+from fetcher import Page, PageFetcher, BrowserFetcher, HttpFetcher, FetcherPool
+from job_queue import JobQueue, print_jobs
+from media import MediaDownloader, MAX_MEDIA_MB
+from page_archive import PageArchive
+from page_cache import CachingFetcher, PageCache, MAX_SIZE_MB, TTL_HOURS
+from blob_store import open_blob_store
+from bulk_writer import BulkWriter, BufferedCollection
+from checkpoints import CheckpointStore, print_checkpoints
+from rate_limit import AdaptiveRateLimiter, PolitenessBudget
+from telemetry import metrics
 
 # Constants
 STATS_LEGEND = ["replies_int", "reposts_int", "quotes_int", "likes_int", "views_video_int"]
@@ -26,10 +48,24 @@ ATTACHMENTS_DB = "attachments"
 COMMENTS_DB = "comments"
 TWEETS_DB = "tweets"
 PROFILE_DB = "profile"
-SLEEPER_MIN = 15
-SLEEP_INTERVAL = lambda: random.randint(2, 4)
+CHECKPOINTS_DB = "checkpoints"
+SNAPSHOTS_DB = "stats_snapshots"
+JOBS_DB = "jobs"
+ARCHIVE_NAME = "archive"
+PAGE_LOAD_TIMEOUT = 60
+# Media URLs are read from the DOM, so the browser never needs to load them
+BLOCKED_URLS = ["*/pic/*", "*/video/*", "*.twimg.com/*", "*.jpg*", "*.jpeg*", "*.png*", "*.gif*", "*.webp*", "*.mp4*", "*.m3u8*", "*.woff*", "*.ttf*", "*.otf*"]
 MAX_DEPTH = 9999
+FRONTIER_SAVE_SECONDS = 30  # Reply crawl frontier save interval, finished threads are recorded with it
 MAX_ATTEMPTS = 3
+HIGH_WATER_MARGIN = 3  # Tweets at or below the high-water mark seen before paging stops
+# Value of a tweet's reply thread: weighted log of its counters, halved per half-life of age
+THREAD_SCORE_WEIGHTS = {"replies_int": 3.0, "quotes_int": 2.0, "views_video_int": 1.0}
+RECENCY_HALF_LIFE_DAYS = 30.0
+# A stats refresh only reads tweets, pagination and error panels. The class is
+# matched per word since Nitter renders e.g. class="timeline-item ".
+STATS_PAGE_CLASSES = {"timeline-item", "show-more", "timeline-end", "error-panel"}
+STATS_PAGE_STRAINER = SoupStrainer(class_=lambda c: c is not None and not STATS_PAGE_CLASSES.isdisjoint(c.split()))
 
 # Field Names
 ID_NAME = "tweet_id_str"
@@ -43,6 +79,9 @@ MENTIONS_NAME = "mentions_list"
 TWEET_ID_NAME = "ref_tweet_id_str"
 PROFILE_TWEET_ID_NAME = "profile_tweet_id_str"
 QUOTE_NAME = "quote"
+STATS_UPDATED_NAME = "stats_updated_utc_iso"
+SNAPSHOT_TIME_NAME = "snapshot_utc_date"
+SNAPSHOT_META_NAME = "meta"
 
 
 def us_number_to_int(string: str) -> int:
@@ -51,11 +90,11 @@ def us_number_to_int(string: str) -> int:
     return 0 if string_transformed in ["GIF", ""] else int(string_transformed)
 
 
-def extract_tweet_metadata(soup: BeautifulSoup) -> Optional[Dict[str, Any]]:
-    """Extracts metadata such as stats, hashtags, mentions, and links from a tweet."""
-    contents: Dict[str, Any] = {}
+def extract_stats(soup: BeautifulSoup) -> Optional[Dict[str, int]]:
+    """Extracts the engagement counters (replies, reposts, quotes, likes, views) of a tweet."""
+    contents: Dict[str, int] = {}
     stats_raw = soup.find_all("span", class_="tweet-stat")
-    
+
     if not stats_raw:
         return None
 
@@ -64,6 +103,14 @@ def extract_tweet_metadata(soup: BeautifulSoup) -> Optional[Dict[str, Any]]:
             contents[STATS_LEGEND[idx]] = us_number_to_int(stat.getText())
         except (ValueError, IndexError):
             print("Error parsing tweet stats: ", soup.prettify())
+    return contents
+
+
+def extract_tweet_metadata(soup: BeautifulSoup) -> Optional[Dict[str, Any]]:
+    """Extracts metadata such as stats, hashtags, mentions, and links from a tweet."""
+    contents: Dict[str, Any] = extract_stats(soup)
+    if contents is None:
+        return None
     
     text_div = soup.find("div", class_="tweet-content")
     if not text_div:
@@ -102,24 +149,23 @@ def extract_user_info(soup: BeautifulSoup, class_name: str) -> Dict[str, str]:
     return user_info
 
 
-def extract_media(soup: BeautifulSoup) -> List[Dict[str, Union[str, bytes]]]:
-    """Extracts media (images/videos) from a tweet."""
+def extract_media(soup: BeautifulSoup, page_url: str = None) -> List[str]:
+    """Extracts media (images/videos) URLs from a tweet, resolved against ``page_url`` (Nitter links them relative)."""
     media_list = []
     media_raw = soup.find("div", class_="attachments")
     
     if media_raw:
         for img in media_raw.find_all("img"):
-            media_url = img["src"]
-            media_list.append({"media_url_str": media_url, "binary_data_bytes": requests.get(media_url).content})
+            media_list.append(urljoin(page_url, img["src"]) if page_url else img["src"])
 
         for video in media_raw.find_all("video"):
-            video_url = video.find("source")["src"]
-            media_list.append({"media_url_str": video_url, "binary_data_bytes": requests.get(video_url).content})
+            src = video.find("source")["src"]
+            media_list.append(urljoin(page_url, src) if page_url else src)
     
     return media_list
 
 
-def extract_quote(soup: BeautifulSoup, attachments_con: Any, attachments: bool) -> Optional[Dict[str, Any]]:
+def extract_quote(soup: BeautifulSoup, attachments_con: Any, attachments: bool, downloader: MediaDownloader = None, page_url: str = None) -> Optional[Dict[str, Any]]:
     """Extracts quoted tweet information."""
     quote_raw = soup.find("div", class_="quote")
     if not quote_raw:
@@ -139,20 +185,16 @@ def extract_quote(soup: BeautifulSoup, attachments_con: Any, attachments: bool)
     if datetime_data:
         quote_contents.update({f"{QUOTE_NAME}_{k}": v for k, v in datetime_data.items()})
 
-    media = extract_media(soup)
+    media = extract_media(soup, page_url)
     if media and attachments:
-        quote_contents[f"{QUOTE_NAME}_{MEDIA_NAME}"] = [m["media_url_str"] for m in media]
-        try:
-            insert_one_tweet(attachments_con, {TWEET_ID_NAME: quote_contents[f"{QUOTE_NAME}_{ID_NAME}"], MEDIA_NAME: media, f"{QUOTE_NAME}_bool": True})
-        except (DocumentTooLarge, WriteError):
-            insert_one_tweet(attachments_con, {TWEET_ID_NAME: quote_contents[f"{QUOTE_NAME}_{ID_NAME}"], MEDIA_NAME: "Too large to store in database.", f"{QUOTE_NAME}_bool": True})
-            print("Media too large to store in database, skipping.")
+        quote_contents[f"{QUOTE_NAME}_{MEDIA_NAME}"] = media
+        downloader.attach(attachments_con, {TWEET_ID_NAME: quote_contents[f"{QUOTE_NAME}_{ID_NAME}"], f"{QUOTE_NAME}_bool": True}, media)
     
     return quote_contents
 
 
-def parse_tweet(soup: BeautifulSoup, existing_entries: list, attachments_con: Any, is_profile_tweet: bool, waiting_time_days: int, attachments: bool, profile_info: dict = None) -> Optional[Union[Dict[str, Any], int]]:
-    """Tweet parsing function for both timeline and conversation tweets."""
+def parse_tweet_key(soup: BeautifulSoup) -> Optional[Tuple[Dict[str, Any], Dict[str, str], str]]:
+    """Parses the fields that identify a tweet; returns them, the author and the tweet's hash."""
     contents = extract_tweet_metadata(soup)
     if contents is None:
         return None
@@ -167,7 +209,19 @@ def parse_tweet(soup: BeautifulSoup, existing_entries: list, attachments_con: An
         return None
     contents.update(user_info)
     
-    tweet_hash = hash_object(contents[TEXT_NAME] + contents[DATETIME_NAME] + contents["username_str"])
+    return contents, user_info, hash_object(contents[TEXT_NAME] + contents[DATETIME_NAME] + contents["username_str"])
+
+
+def parse_tweet(soup: BeautifulSoup, existing_entries: HashScope, attachments_con: Any, is_profile_tweet: bool, waiting_time_days: int, attachments: bool, profile_info: dict = None, downloader: MediaDownloader = None, key: Tuple[Dict[str, Any], Dict[str, str], str] = None, page_url: str = None) -> Optional[Union[Dict[str, Any], int]]:
+    """Tweet parsing function for both timeline and conversation tweets.
+
+    ``key`` is the result of ``parse_tweet_key`` if the caller already has it.
+    Media URLs are resolved against ``page_url``.
+    """
+    key = key or parse_tweet_key(soup)
+    if key is None:
+        return None
+    contents, user_info, tweet_hash = key
     if tweet_hash in existing_entries:
         print("Tweet already scraped.")
         return -1
@@ -187,30 +241,21 @@ def parse_tweet(soup: BeautifulSoup, existing_entries: list, attachments_con: An
             contents["repost_fullname_str"] = user_info["fullname_str"]
 
     
-    quote = extract_quote(soup, attachments_con, attachments)
+    quote = extract_quote(soup, attachments_con, attachments, downloader, page_url)
     if quote:
         contents.update(quote)
 
     if attachments:
-        media = extract_media(soup)
-        if media:
-            media_list = [m["media_url_str"] for m in media]
+        media_list = extract_media(soup, page_url)
+        if media_list:
             if quote:
-                remaining_attachments = set(media_list) - set(quote[f"{QUOTE_NAME}_{MEDIA_NAME}"])
+                remaining_attachments = [m for m in media_list if m not in quote.get(f"{QUOTE_NAME}_{MEDIA_NAME}", [])]
                 if len(remaining_attachments) > 0:
                     contents[MEDIA_NAME] = remaining_attachments
-                    try:
-                        insert_one_tweet(attachments_con, {TWEET_ID_NAME: contents[ID_NAME], MEDIA_NAME: [m for m in media if m["media_url_str"] in remaining_attachments]})
-                    except (DocumentTooLarge, WriteError):
-                        insert_one_tweet(attachments_con, {TWEET_ID_NAME: contents[ID_NAME], MEDIA_NAME: "Too large to store in database."})
-                        print("Media too large to store in database, skipping.")
+                    downloader.attach(attachments_con, {TWEET_ID_NAME: contents[ID_NAME]}, remaining_attachments)
             else:
                 contents[MEDIA_NAME] = media_list
-                try:
-                    insert_one_tweet(attachments_con, {TWEET_ID_NAME: contents[ID_NAME], MEDIA_NAME: media})
-                except (DocumentTooLarge, WriteError):
-                    insert_one_tweet(attachments_con, {TWEET_ID_NAME: contents[ID_NAME], MEDIA_NAME: "Too large to store in database."})
-                    print("Media too large to store in database, skipping.")
+                downloader.attach(attachments_con, {TWEET_ID_NAME: contents[ID_NAME]}, media_list)
     return contents
 
 
@@ -305,19 +350,44 @@ def setup_driver() -> WebDriver:
     """Initialize and return a Chrome WebDriver."""
     options = uc.ChromeOptions()
     options.headless = True
-    return uc.Chrome(use_subprocess=True, options=options, version_main=112)
-
-
-def setup_database() -> Dict[str, Any]:
-    """Establishes a connection to the MongoDB database."""
+    options.page_load_strategy = "eager"  # Nitter renders server-side, the DOM is complete at DOMContentLoaded
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_argument("--autoplay-policy=user-gesture-required")
+    driver = uc.Chrome(use_subprocess=True, options=options, version_main=112)
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+    return driver
+
+
+def setup_fetcher(engine: str, drivers: DriverPool, limiter: AdaptiveRateLimiter, budget: PolitenessBudget = None, cache: PageCache = None, prefetch: bool = True) -> PageFetcher:
+    """Return the page fetch backend; the HTTP engine falls back to Chrome when needed."""
+    fetcher = BrowserFetcher(drivers, limiter, budget, prefetching=prefetch)
+    if engine == "http":
+        fetcher = HttpFetcher(fetcher, limiter, budget, prefetch)
+    if cache is not None:
+        fetcher = CachingFetcher(fetcher, cache)
+    return fetcher
+
+
+def setup_database(writer: BulkWriter = None) -> Dict[str, Any]:
+    """Establishes a connection to the MongoDB database and creates missing indexes, buffering writes through ``writer`` if given."""
     try:
         db = mongo_authenticate("./")["xdb"]
-        return {
+        ensure_indexes(db)
+        ensure_time_series(db, SNAPSHOTS_DB, SNAPSHOT_TIME_NAME, SNAPSHOT_META_NAME)
+        collections = {
             "attachments": db[ATTACHMENTS_DB],
             "comments": db[COMMENTS_DB],
             "tweets": db[TWEETS_DB],
             "profile": db[PROFILE_DB],
+            "stats_snapshots": db[SNAPSHOTS_DB],
         }
+        if writer is not None:
+            collections = {k: BufferedCollection(v, writer) for k, v in collections.items()}
+        collections["checkpoints"] = CheckpointStore(db[CHECKPOINTS_DB], writer)
+        collections["jobs"] = JobQueue(db[JOBS_DB])
+        return collections
     except Exception as e:
         print("Database connection failed:", e)
         exit(1)
@@ -327,191 +397,553 @@ def tweet_url(profile_url: str, tweet_id: str) -> str:
     return f"{profile_url}/status/{tweet_id}"
 
 
-def scrape_tweets(driver: WebDriver, url: str, db_collections: Any, force_rescrape: str, max_items: int, is_profile: bool, waiting_time_days: int, attachments: bool, depth: int = None, profile_tweet: str = None) -> List[str]:
-    """Generic function to scrape tweets from a profile or a conversation thread."""
+def parse_page(page: Page) -> BeautifulSoup:
+    """Parses a page snapshot once; tweets, profile card, errors and pagination are all read from it."""
+    start = time.perf_counter()
+    soup = BeautifulSoup(page.html, "html.parser")
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    metrics.observe("parse", elapsed_ms / 1000)
+    print(f"Parsed page in {elapsed_ms:.1f} ms ({page.round_trips} {page.backend} round trips).")
+    return soup
+
+
+def timeline_position(soup: BeautifulSoup, waiting_time_days: int) -> Optional[Tuple[int, str, bool]]:
+    """Returns (tweet ID, datetime, old enough to scrape) of a timeline tweet.
+
+    Pinned tweets and reposts are out of chronological order and return None,
+    so they never move or trigger the high-water mark.
+    """
+    if soup.find(class_="pinned") or soup.find("div", class_="retweet-header"):
+        return None
+    date_span = soup.find("span", class_="tweet-date")
+    if date_span is None or date_span.find("a") is None:
+        return None
+    datetime_data = extract_datetime_and_id(soup)
+    if not datetime_data[ID_NAME].isdigit():
+        return None
+    old_enough = datetime.now() - datetime.fromisoformat(datetime_data[DATETIME_NAME]) > timedelta(days = waiting_time_days)
+    return int(datetime_data[ID_NAME]), datetime_data[DATETIME_NAME], old_enough
+
+
+def thread_score(tweet_data: Dict[str, Any]) -> float:
+    """Ranks a tweet's replies for scraping: more replies, quotes and views and a younger tweet score higher."""
+    score = sum(weight * math.log1p(tweet_data.get(key) or 0) for key, weight in THREAD_SCORE_WEIGHTS.items())
+    age_days = max(0.0, (datetime.utcnow() - datetime.fromisoformat(tweet_data[DATETIME_NAME])).total_seconds() / 86400)
+    return score * 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+
+
+def budget_exhausted(fetcher: PageFetcher) -> bool:
+    """Whether the run's page budget (``--page-budget``) is used up."""
+    return fetcher.budget is not None and fetcher.budget.exhausted()
+
+
+def find_heading(soup: BeautifulSoup, text: str) -> bool:
+    """Checks for a Nitter status heading such as "No more items"."""
+    return any(text in h2.get_text() for h2 in soup.find_all("h2"))
+
+
+def find_load_more(soup: BeautifulSoup) -> Optional[str]:
+    """Returns the (possibly relative) href of the "Load more" link, if any."""
+    for link in soup.find_all("a", href=True):
+        if link.get_text(strip=True) == "Load more":
+            return link["href"]
+    return None
+
+
+class ScrapeFailed(Exception):
+    """A page could not be loaded in ``MAX_ATTEMPTS`` attempts."""
+
+
+def scrape_tweets(fetcher: PageFetcher, url: str, db_collections: Any, force_rescrape: str, max_items: int, is_profile: bool, waiting_time_days: int, attachments: bool, depth: int = None, profile_tweet: str = None, dedup_index: DedupIndex = None, downloader: MediaDownloader = None, scores: Dict[str, float] = None, max_pages: int = 0) -> List[str]:
+    """Generic function to scrape tweets from a profile or a conversation thread.
+
+    Returns the tweet IDs (profile) or URLs (conversation) of new tweets with
+    replies, and their ``thread_score`` in ``scores`` if given. A conversation
+    stops after ``max_pages`` pages (0 for no limit). Once the run's page
+    budget is used up, paging stops and the checkpoint is kept, so the next
+    run continues from there. ``downloader`` is required with ``attachments``;
+    the caller owns it and closes it. Raises ``ScrapeFailed`` when a page
+    cannot be loaded, keeping the checkpoint at that page.
+    """
     print(f"Scraping profile {url}...") if is_profile else print(f"Scraping tweet {url}...")
 
     db_key = TWEETS_DB if is_profile else COMMENTS_DB
+    if dedup_index is None:
+        dedup_index = DedupIndex()
+    if downloader is None and attachments:
+        raise ValueError("scrape_tweets needs a downloader to store attachments")
 
-    # Rescraping logic
+    # Rescraping logic: forced scopes start empty and only track this run's writes
     if is_profile and force_rescrape in ["both", "tweets"]:
-        existing_entries = list()
+        existing_entries = dedup_index.scope(f"{db_key}:forced:{extract_last_url_element(url)}")
         allow_profile_scrape = True
     elif not is_profile and force_rescrape in ["both", "comments"]:
-        existing_entries = list()
+        existing_entries = dedup_index.scope(f"{db_key}:forced:{profile_tweet}")
     else:
         if is_profile:
-            existing_entries = get_hash_of_all_tweets(db_collections[db_key], extract_last_url_element(url))
+            existing_entries = dedup_index.profile_scope(db_collections[db_key], extract_last_url_element(url))
             profile_info = get_tweet_by_username(db_collections[PROFILE_DB], extract_last_url_element(url))
             if profile_info:
                 allow_profile_scrape = False
             else:
                 allow_profile_scrape = True
         else:
-            existing_entries = get_hash_of_all_tweets(db_collections[db_key])
+            existing_entries = dedup_index.conversation_scope(db_collections[db_key], profile_tweet)
         
     tweets_with_replies = []
     tweet_counter = 0
+    pages_loaded = 0
     tweet_class = "timeline-item" if is_profile else "reply"
 
+    # Resume from the last "Load more" cursor of an interrupted run
+    checkpoints = db_collections[CHECKPOINTS_DB]
+    checkpoint_key = f"{db_key}:{url}"
+    resume_url = url
+    checkpoint = checkpoints.load(checkpoint_key)
+    if checkpoint:
+        resume_url = checkpoint["cursor_url_str"]
+        tweet_counter = checkpoint["items_seen_int"]
+        tweets_with_replies = checkpoint["with_replies_list"]
+        print(f"Resuming from checkpoint after {tweet_counter} items: {resume_url}")
+
+    archive = db_collections.get(ARCHIVE_NAME)
+
+    page_kind = "conversation" if not is_profile else "status" if "/status/" in url else "timeline"
+
+    def keep(page: Page) -> None:
+        # Raw HTML plus what is needed to parse it again offline (see reparse.py)
+        if archive is not None and not page.rate_limited:
+            archive.add(page, kind=page_kind, thread_url=url, profile_tweet=profile_tweet, depth=depth)
+
+    def finish(result: Optional[List[str]]) -> Optional[List[str]]:
+        checkpoints.clear(checkpoint_key)
+        return result
+
+    def fail(reason: str) -> None:
+        # The position is kept, so the next attempt of the run or job continues here
+        if resume_url != url or tweets_with_replies:
+            checkpoints.save_cursor(checkpoint_key, resume_url, tweet_counter, tweets_with_replies)
+        raise ScrapeFailed(f"{url}: {reason}")
+
+    # Incremental profile scraping: a run that covered the timeline from the top
+    # down to the previous high-water mark (or its end) moves the mark up to the
+    # newest tweet old enough to be scraped; later runs stop once past it.
+    track_mark = is_profile and "/status/" not in url and not checkpoint
+    mark = get_high_water_mark(db_collections[PROFILE_DB], extract_last_url_element(url)) if track_mark else None
+    stop_at_mark = mark is not None and force_rescrape not in ["both", "tweets"]
+    newest = None  # (tweet ID, datetime) of the newest old-enough tweet seen
+    past_mark = 0
+
+    def advance_mark() -> None:
+        if track_mark and newest is not None and (mark is None or newest[0] > int(mark[HIGH_WATER_ID_NAME])):
+            set_high_water_mark(db_collections[PROFILE_DB], extract_last_url_element(url), str(newest[0]), newest[1])
+            print(f"High-water mark moved to tweet {newest[0]}.")
+
     for attempt in range(MAX_ATTEMPTS):
         if attempt > 0:  # Only show attempt message for retries
             print(f"Attempt {attempt + 1} of {MAX_ATTEMPTS}")
+            metrics.inc("scraper_retries_total", reason="attempt")
 
         # Handle error pages
         try:
-            driver.get(url)
-            sleep(SLEEPER_MIN + SLEEP_INTERVAL())
-            if "429 Too Many Requests" in driver.page_source:
-                print("Rate limit reached.")
-                if attempt < MAX_ATTEMPTS - 1:  # Only sleep if we're going to retry
-                    print(f"Retrying in 120 seconds...")
-                    sleep(120 + SLEEP_INTERVAL())
+            page = fetcher.get(resume_url)
+            keep(page)
+            if page.rate_limited:
+                print("Rate limit reached.")  # The fetcher's rate limiter already backs off
                 continue # Next attempt
             else:
-                error_panel = driver.find_elements(By.CLASS_NAME, "error-panel")
+                page_soup = parse_page(page)
+                error_panel = page_soup.find(class_="error-panel")
+                if error_panel and resume_url != url:
+                    print("Checkpoint cursor no longer valid, starting from the first page.")
+                    checkpoints.clear(checkpoint_key)
+                    resume_url = url
+                    continue
                 if error_panel:
                     print("Error panel found.")
-                    error_panel_soup = BeautifulSoup(error_panel[0].get_attribute("outerHTML"), "html.parser")
-                    error_text = error_panel_soup.get_text()
+                    error_text = error_panel.get_text()
                     # Additional checks for suspension or not found
                     if is_profile:
                         username = extract_last_url_element(url)
                         if "has been suspended" in error_text:
-                            insert_one_tweet(db_collections[PROFILE_DB], {"username_str": username, "category_str": "Suspended"})
+                            upsert_one_tweet(db_collections[PROFILE_DB], {"username_str": username, "category_str": "Suspended"}, UNIQUE_KEYS[PROFILE_DB])
                             print(f"Profile {username} has been suspended.")
-                            return None
+                            return finish(None)
                         elif "not found" in error_text.lower():
-                            insert_one_tweet(db_collections[PROFILE_DB], {"username_str": username, "category_str": "Not found"})
+                            upsert_one_tweet(db_collections[PROFILE_DB], {"username_str": username, "category_str": "Not found"}, UNIQUE_KEYS[PROFILE_DB])
                             print(f"Profile {username} not found.")
-                            return None
+                            return finish(None)
                     if error_text == "Page not found":
                         print("Page not found.")
-                        return None
+                        return finish(None)
                     else:
                         print(f"Error: {error_text}")
-                        return None
+                        return finish(None)
                 # Check for "No items found" message
-                no_items = driver.find_elements(By.XPATH, "//h2[contains(text(), 'No items found')]")
-                if no_items:
+                if find_heading(page_soup, "No items found"):
                     print("No tweets found for this profile.")
-                    return None
+                    return finish(None)
                 # else continue as usual
         except Exception as e:
             # Handle other errors (e.g., network issues)
             print(f"Error: {e}")
-            driver.save_screenshot("error.png")
+            fetcher.save_debug("error")
             if attempt < MAX_ATTEMPTS - 1:  # Only retry if we haven't hit max attempts
                 continue
-            return None
+            fail(str(e))
 
         # Store profile info
         if is_profile and allow_profile_scrape:
-            try:
-                profile_info_src = driver.find_element(By.CLASS_NAME, "profile-card")
-                profile_info_src = BeautifulSoup(profile_info_src.get_attribute("outerHTML"), "html.parser")
-                if profile_info_src:
-                    profile_info = scrape_profile_info(profile_info_src)
-                    if profile_info:
-                        insert_one_tweet(db_collections[PROFILE_DB], profile_info)
-                    else:
-                        profile_info = None
-                        print("Error scraping profile information.")
+            profile_info_src = page_soup.find(class_="profile-card")
+            if profile_info_src:
+                profile_info = scrape_profile_info(profile_info_src)
+                if profile_info:
+                    upsert_one_tweet(db_collections[PROFILE_DB], profile_info, UNIQUE_KEYS[PROFILE_DB])
                 else:
                     profile_info = None
                     print("Error scraping profile information.")
-            except NoSuchElementException:
-                profile_info = None
-                pass  # Probably single tweet scrape, TODO: better solution
+            else:
+                profile_info = None  # Probably single tweet scrape, TODO: better solution
         
         if (max_items == 0):
             return None
         
         while True:
-            timeline = driver.find_elements(By.CLASS_NAME, tweet_class)
-
-            for tweet in timeline:
-                try:
-                    tweet_body = tweet.find_element(By.TAG_NAME, "div")
-                    tweet_soup = BeautifulSoup(tweet_body.get_attribute("outerHTML"), "html.parser")
+            timeline = page_soup.find_all(class_=tweet_class)
+            # Known tweets of the whole page are looked up with one query
+            tweet_soups = [s for s in (tweet.find("div") for tweet in timeline) if s is not None]  # Ignore non-tweet elements
+            with metrics.timer("parse_tweet"):
+                keys = [parse_tweet_key(s) for s in tweet_soups]
+            existing_entries.check([k[2] for k in keys if k])
+
+            # Load the next page while this one is parsed and stored, unless it
+            # is unlikely to be needed (item limit or high-water mark in reach,
+            # or a known reply, where a thread stops)
+            load_more = find_load_more(page_soup)
+            pages_loaded += 1
+            last_page = (max_pages and not is_profile and pages_loaded >= max_pages) or budget_exhausted(fetcher)
+            known_reply = not is_profile and any(k and k[2] in existing_entries for k in keys)
+            if load_more and not last_page and not known_reply and max_items - tweet_counter > len(timeline):
+                oldest = next((p for p in map(lambda t: timeline_position(t, waiting_time_days), reversed(timeline)) if p), None) if stop_at_mark else None
+                if oldest is None or oldest[0] > int(mark[HIGH_WATER_ID_NAME]):
+                    fetcher.prefetch(urljoin(page.url, load_more))
+
+            for tweet_soup, key in zip(tweet_soups, keys):
+                with metrics.timer("parse_tweet"):
                     if is_profile:
-                        tweet_data = parse_tweet(tweet_soup, existing_entries, db_collections[ATTACHMENTS_DB], is_profile, waiting_time_days, attachments, profile_info)
+                        tweet_data = parse_tweet(tweet_soup, existing_entries, db_collections[ATTACHMENTS_DB], is_profile, waiting_time_days, attachments, profile_info, downloader, key, page.url)
                     else:
-                        tweet_data = parse_tweet(tweet_soup, existing_entries, db_collections[ATTACHMENTS_DB], is_profile, waiting_time_days, attachments)
-
-                    if tweet_data == -1:
-                        if not is_profile:
-                            print(f"Scraped {tweet_counter} new {'tweets' if is_profile else 'comments'}.")
-                            return None if len(tweets_with_replies) == 0 else tweets_with_replies  # Stop scraping
-                    elif tweet_data:
-                        if is_profile == False:
-                            tweet_data.update({TWEET_ID_NAME: url})
-                            tweet_data.update({PROFILE_TWEET_ID_NAME: profile_tweet})
-                            tweet_data.update({"depth_int": depth})
-
-                        insert_one_tweet(db_collections[db_key], tweet_data)
-                        tweet_counter += 1
-
-                        if is_profile:
-                            if tweet_data["replies_int"] > 0:
-                                tweets_with_replies.append(tweet_data[ID_NAME])
-                        else:
-                            if tweet_data["replies_int"] > 0:
-                                tweets_with_replies.append(f"https://xcancel.com/{tweet_data['username_str']}/status/{tweet_data[ID_NAME]}")
-
-                    if tweet_counter >= max_items:
+                        tweet_data = parse_tweet(tweet_soup, existing_entries, db_collections[ATTACHMENTS_DB], is_profile, waiting_time_days, attachments, downloader=downloader, key=key, page_url=page.url)
+
+                if tweet_data == -1:
+                    if not is_profile:
                         print(f"Scraped {tweet_counter} new {'tweets' if is_profile else 'comments'}.")
-                        return tweets_with_replies  # Stop if max tweets reached
-                except NoSuchElementException:
-                    pass  # Ignore non-tweet elements
+                        return finish(None if len(tweets_with_replies) == 0 else tweets_with_replies)  # Stop scraping
+                elif tweet_data:
+                    if is_profile == False:
+                        tweet_data.update({TWEET_ID_NAME: url})
+                        tweet_data.update({PROFILE_TWEET_ID_NAME: profile_tweet})
+                        tweet_data.update({"depth_int": depth})
+
+                    upsert_one_tweet(db_collections[db_key], tweet_data, UNIQUE_KEYS[db_key])
+                    existing_entries.add(tweet_data["hash256_str"])
+                    tweet_counter += 1
+
+                    if tweet_data["replies_int"] > 0:
+                        key = tweet_data[ID_NAME] if is_profile else f"https://xcancel.com/{tweet_data['username_str']}/status/{tweet_data[ID_NAME]}"
+                        tweets_with_replies.append(key)
+                        if scores is not None:
+                            scores[key] = thread_score(tweet_data)
+
+                position = timeline_position(tweet_soup, waiting_time_days) if track_mark else None
+                if position:
+                    if position[2] and (newest is None or position[0] > newest[0]):
+                        newest = position[:2]
+                    if stop_at_mark and position[0] <= int(mark[HIGH_WATER_ID_NAME]):
+                        past_mark += 1
+                        if past_mark >= HIGH_WATER_MARGIN:
+                            print(f"Reached high-water mark. Scraped {tweet_counter} new tweets.")
+                            advance_mark()
+                            return finish(None if len(tweets_with_replies) == 0 else tweets_with_replies)
+
+                if tweet_counter >= max_items:
+                    print(f"Scraped {tweet_counter} new {'tweets' if is_profile else 'comments'}.")
+                    return finish(tweets_with_replies)  # Stop if max tweets reached
             
             # Handle pagination
             try:
-                load_more = driver.find_elements(By.LINK_TEXT, "Load more")
-                no_more = driver.find_elements(By.XPATH, "//h2[contains(.,'No more items')]")
-                icon_down = driver.find_elements(By.CSS_SELECTOR, "a.icon-down")
+                no_more = find_heading(page_soup, "No more items")
+                icon_down = page_soup.select("a.icon-down")
 
+                if load_more and max_pages and not is_profile and pages_loaded >= max_pages:
+                    print(f"Reached the limit of {max_pages} pages per thread. Scraped {tweet_counter} new comments.")
+                    return finish(None if len(tweets_with_replies) == 0 else tweets_with_replies)
                 if load_more:
-                    driver.get(load_more[0].get_attribute('href'))
-                    sleep(SLEEPER_MIN + SLEEP_INTERVAL())
+                    next_url = urljoin(page.url, load_more)
+                    checkpoints.save_cursor(checkpoint_key, next_url, tweet_counter, tweets_with_replies)
+                    resume_url = next_url  # Retries continue from here, not from page one
+                    if budget_exhausted(fetcher):
+                        print(f"Page budget used up. Scraped {tweet_counter} new {'tweets' if is_profile else 'comments'}, the next run continues here.")
+                        return None if len(tweets_with_replies) == 0 else tweets_with_replies
+                    for _ in range(MAX_ATTEMPTS):
+                        page = fetcher.get(next_url)
+                        if not page.rate_limited:
+                            break
+                        print("Rate limit reached, retrying the same page.")
+                        metrics.inc("scraper_retries_total", reason="rate_limited_page")
+                    keep(page)
+                    page_soup = parse_page(page)
                 elif no_more or icon_down:
                     print(f"Scraped {tweet_counter} new {'tweets' if is_profile else 'comments'}.")
-                    return None if len(tweets_with_replies) == 0 else tweets_with_replies
+                    advance_mark()
+                    return finish(None if len(tweets_with_replies) == 0 else tweets_with_replies)
                 else:
                     print("No pagination elements found.")
-                    driver.save_screenshot("error.png")
+                    fetcher.save_debug("error")
                     if attempt < MAX_ATTEMPTS - 1:  # Only retry if we haven't hit max attempts
-                        print(f"Retrying in 120 seconds...")
-                        sleep(120 + SLEEP_INTERVAL())
+                        fetcher.limiter.on_rate_limited()  # Usually a soft rate limit
                         break  # Break the inner while loop to retry the attempt
                     else:
                         print("Max attempts reached. Aborting.")
-                        return None if len(tweets_with_replies) == 0 else tweets_with_replies
-            except NoSuchElementException:
-                print("Error finding pagination elements.")
-                driver.save_screenshot("error.png")
+                        fail("no pagination elements found")
+            except ScrapeFailed:
+                raise
+            except Exception as e:
+                print(f"Error loading next page: {e}")
+                fetcher.save_debug("error")
                 if attempt < MAX_ATTEMPTS - 1:  # Only retry if we haven't hit max attempts
-                    print(f"Retrying in 120 seconds...")
-                    sleep(120 + SLEEP_INTERVAL())
+                    fetcher.limiter.on_rate_limited()
                     break  # Break the inner while loop to retry the attempt
                 else:
                     print("Max attempts reached. Aborting.")
-                    return None if len(tweets_with_replies) == 0 else tweets_with_replies
+                    fail(str(e))
     
     print(f"Scraping failed after {MAX_ATTEMPTS} attempts.")
-    driver.save_screenshot("error.png")
-    return None if len(tweets_with_replies) == 0 else tweets_with_replies
-
+    fetcher.save_debug("error")
+    fail(f"failed after {MAX_ATTEMPTS} attempts")
+
+
+def crawl_replies(fetchers: FetcherPool, db_collections: Any, comments: List, force_rescrape: str, max_comments: int, attachments: bool, depth: int, profile_tweet: str, dedup_index: DedupIndex = None, downloader: MediaDownloader = None, max_depth: int = MAX_DEPTH, max_per_depth: int = 0, max_per_root: int = 0, scores: Dict[str, float] = None, max_thread_pages: int = 0) -> None:
+    """Best-first crawl of comments of comments with concurrent fetchers.
+
+    ``comments`` are the reply URLs found at ``depth - 1``. URLs wait in a
+    frontier ordered by their ``thread_score`` (from ``scores``, filled in as
+    threads are scraped), shallower first on ties, and are handed to up to
+    ``fetchers.size`` threads; each URL is visited once. ``max_per_depth`` and
+    ``max_per_root`` cap the number of conversation pages per depth level and
+    for the whole root tweet (0 means unlimited), which also bounds the
+    frontier's memory. A thread that fails is queued again, up to
+    ``MAX_ATTEMPTS`` times, then kept in the checkpoint; the crawl raises
+    ``ScrapeFailed`` once the other threads are done. When the run's
+    page budget is used up, the crawl stops and the frontier is kept for the
+    next run.
+    """
+    scores = {} if scores is None else scores
+    order = itertools.count()
+    frontier: List[Tuple[float, int, int, str]] = []
+    visited = set()
+    per_depth = Counter()
+    in_flight = {}
+    done = []  # Finished since the frontier was last saved
+    attempts = Counter()
+    failed = {}  # Threads that failed MAX_ATTEMPTS times, left for the next run
+    saved = time.monotonic()
+
+    def push(url: str, level: int, score: float = None) -> None:
+        heapq.heappush(frontier, (-(scores.get(url, 0.0) if score is None else score), level, next(order), url))
+
+    for url in comments:
+        push(url, depth)
+
+    checkpoints = db_collections[CHECKPOINTS_DB]
+    checkpoint = checkpoints.load(f"crawl:{profile_tweet}")
+    if checkpoint:
+        done = checkpoint.get("done_list", [])  # Older checkpoints keep them in a list, they are moved on the next save
+        finished = checkpoints.load_done(profile_tweet) + done
+        visited.update(finished)
+        for pending in checkpoint["pending_list"]:
+            push(*pending)  # [url, level] or [url, level, score]
+        print(f"Resuming reply crawl of {profile_tweet}: {len(set(finished))} threads done, {len(checkpoint['pending_list'])} pending.")
+    elif not frontier:
+        return  # No new comments and nothing left from an earlier run
+
+    def admit(url: str, level: int) -> bool:
+        if url in visited or level >= max_depth:
+            return False
+        if max_per_root and len(visited) >= max_per_root:
+            return False
+        if max_per_depth and per_depth[level] >= max_per_depth:
+            return False
+        visited.add(url)
+        per_depth[level] += 1
+        return True
 
-def deep_scrape(driver: WebDriver, db_collections: Any, comments: List, force_rescrape: str, max_comments: int, attachments: bool, depth: int, profile_tweet: str) -> None:
-    """Recursively scrape comments of comments up to MAX_DEPTH levels deep."""
-    if depth >= MAX_DEPTH:
-        return  
-    
-    for comment_url in comments:
-        nested_comments = scrape_tweets(driver, comment_url, db_collections, force_rescrape, max_comments, False, 0, attachments, depth, profile_tweet)
-        if nested_comments:
-            deep_scrape(driver, db_collections, nested_comments, force_rescrape, max_comments, attachments, depth + 1, profile_tweet)
+    def visit(url: str, level: int) -> Optional[List[str]]:
+        with fetchers.acquire() as fetcher:
+            return scrape_tweets(fetcher, url, db_collections, force_rescrape, max_comments, False, 0, attachments, level, profile_tweet, dedup_index, downloader, scores, max_thread_pages)
+
+    def save_frontier() -> None:
+        # In-flight threads are saved as pending, they are redone after a crash
+        pending = [[u, l, sc] for u, l, sc in in_flight.values()] + [[u, l, sc] for u, (l, sc) in failed.items()] + [[u, l, -sc] for sc, l, _, u in frontier if u not in visited]
+        checkpoints.save_frontier(profile_tweet, pending, done)
+        done.clear()
+
+    if not checkpoint:
+        save_frontier()  # The comments were only returned, an interrupted run would lose them
+
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=fetchers.size, thread_name_prefix="crawler") as pool:
+        while frontier or in_flight:
+            exhausted = exhausted or budget_exhausted(fetchers.primary)
+            while frontier and not exhausted and len(in_flight) < fetchers.size:
+                score, level, _, url = heapq.heappop(frontier)
+                if admit(url, level):
+                    in_flight[pool.submit(metrics.bind(visit), url, level)] = (url, level, -score)
+            if not in_flight:
+                if exhausted:
+                    break
+                continue
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                url, level, score = in_flight.pop(future)
+                try:
+                    nested_comments = future.result()
+                except Exception as e:
+                    attempts[url] += 1
+                    if attempts[url] < MAX_ATTEMPTS:
+                        print(f"Error crawling replies of {url}: {e}, retrying.")
+                        visited.discard(url)
+                        per_depth[level] -= 1
+                        push(url, level, score)
+                    else:
+                        print(f"Error crawling replies of {url}: {e}, giving up after {MAX_ATTEMPTS} attempts.")
+                        failed[url] = (level, score)
+                    continue
+                done.append(url)
+                for nested_url in nested_comments or []:
+                    if nested_url not in visited:
+                        push(nested_url, level + 1)
+            if time.monotonic() - saved >= FRONTIER_SAVE_SECONDS:
+                save_frontier()
+                saved = time.monotonic()
+    left = {url for _, _, _, url in frontier if url not in visited}
+    if exhausted and left:
+        save_frontier()
+        print(f"Page budget used up, {len(left)} reply threads of {profile_tweet} left for the next run.")
+        return
+    if failed:
+        save_frontier()
+        raise ScrapeFailed(f"{len(failed)} reply threads of {profile_tweet} failed, they are retried on the next run")
+    checkpoints.clear_frontier(profile_tweet)
+    print(f"Crawled {len(visited)} reply threads of {profile_tweet} ({dict(sorted(per_depth.items()))} per depth).")
+
+
+def parse_stats_page(page: Page) -> BeautifulSoup:
+    """Parses only the tweets, pagination and error panel of a page."""
+    with metrics.timer("parse"):
+        return BeautifulSoup(page.html, "html.parser", parse_only=STATS_PAGE_STRAINER)
+
+
+def store_stats(db_collections: Any, db_key: str, doc: Dict[str, Any], stats: Dict[str, int], now: datetime) -> None:
+    """Appends a stats snapshot and updates the counters of every stored copy of the tweet."""
+    db_collections[SNAPSHOTS_DB].insert_one({SNAPSHOT_TIME_NAME: now, SNAPSHOT_META_NAME: {ID_NAME: doc[ID_NAME], "collection_str": db_key, "username_str": doc.get("username_str")}, **stats})
+    db_collections[db_key].update_many({ID_NAME: doc[ID_NAME]}, {"$set": {**stats, STATS_UPDATED_NAME: now.isoformat()}})
+
+
+def stale_documents(col: Any, query: Dict[str, Any], cutoff: str, limit: int) -> Dict[str, Dict[str, Any]]:
+    """Tweets matching ``query`` whose stats were not refreshed since ``cutoff`` by tweet ID, least recently refreshed first."""
+    stale = {"$or": [{STATS_UPDATED_NAME: {"$lt": cutoff}}, {STATS_UPDATED_NAME: {"$exists": False}}]}
+    fields = {"_id": 0, ID_NAME: 1, "username_str": 1, "repost_username_str": 1, TWEET_ID_NAME: 1}
+    cursor = col.find({**query, **stale}, fields).sort(STATS_UPDATED_NAME, 1).allow_disk_use(True)
+    if limit:
+        cursor = cursor.limit(limit)
+    return {d[ID_NAME]: d for d in cursor if d.get(ID_NAME)}
+
+
+def refresh_from_pages(fetcher: PageFetcher, url: str, targets: Dict[str, Dict[str, Any]], db_collections: Any, db_key: str, chronological: bool = False, max_pages: int = 0) -> int:
+    """Pages through ``url`` and stores the stats of every target tweet on it.
+
+    Found tweets are removed from ``targets``; paging stops once all are found,
+    after ``max_pages`` pages (0 for no limit) or, on a ``chronological``
+    timeline, once it is past the oldest target that is not a repost.
+    """
+    oldest = min((int(i) for i, d in targets.items() if i.isdigit() and "repost_username_str" not in d), default=0)
+    next_url = url
+    pages = rate_limited = refreshed = 0
+    while targets and next_url and (max_pages == 0 or pages < max_pages):
+        page = fetcher.get(next_url)
+        if page.rate_limited:
+            rate_limited += 1
+            if rate_limited >= MAX_ATTEMPTS:
+                print(f"Rate limited {MAX_ATTEMPTS} times in a row, giving up on {url}.")
+                break
+            continue  # The fetcher's rate limiter already backs off
+        rate_limited = 0
+        pages += 1
+        soup = parse_stats_page(page)
+        if soup.find(class_="error-panel"):
+            print(f"Error: {soup.find(class_='error-panel').get_text()}")
+            break
+        passed = False
+        now = datetime.utcnow()
+        for item in soup.find_all(class_="timeline-item"):
+            if item.find("span", class_="tweet-date") is None:
+                continue  # "Load more"/"Load newest" items
+            datetime_data = extract_datetime_and_id(item)
+            if datetime_data is None:
+                continue
+            tweet_id = datetime_data[ID_NAME]
+            stats = extract_stats(item)
+            if tweet_id in targets and stats:
+                store_stats(db_collections, db_key, targets.pop(tweet_id), stats, now)
+                refreshed += 1
+            if chronological and oldest and tweet_id.isdigit() and int(tweet_id) < oldest and timeline_position(item, 0):
+                passed = True
+        load_more = find_load_more(soup)
+        next_url = urljoin(page.url, load_more) if load_more and not passed else None
+    return refreshed
+
+
+def refresh_stats(args: argparse.Namespace, profile: str, fetchers: FetcherPool, db_collections: Any) -> None:
+    """Refreshes the engagement stats of a profile's stored tweets and/or comments.
+
+    Timelines and conversations show the stats of about 20 tweets per page, so
+    stored tweets are matched while paging through them first; only those not
+    found there are revisited on their own status page. Media, quotes and
+    profile information are not touched.
+    """
+    profile_url = f"https://xcancel.com/{profile}"
+    fetcher = fetchers.primary
+    cutoff = (datetime.utcnow() - timedelta(hours=args.refresh_older_than)).isoformat()
+    refreshed = 0
+    missing = []
+
+    if args.refresh_stats in ["both", "tweets"]:
+        targets = stale_documents(db_collections[TWEETS_DB], {"username_str": profile}, cutoff, args.refresh_limit)
+        print(f"Refreshing stats of {len(targets)} tweets of {profile}...")
+        if targets:
+            refreshed += refresh_from_pages(fetcher, profile_url, targets, db_collections, TWEETS_DB, chronological=True)
+        missing += [(TWEETS_DB, d) for d in targets.values()]
+
+    if args.refresh_stats in ["both", "comments"]:
+        query = {PROFILE_TWEET_ID_NAME: {"$regex": f"^{re.escape(profile_url)}/status/"}}
+        targets = stale_documents(db_collections[COMMENTS_DB], query, cutoff, args.refresh_limit)
+        print(f"Refreshing stats of {len(targets)} comments of {profile}...")
+        threads: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for tweet_id, doc in targets.items():
+            threads.setdefault(doc.get(TWEET_ID_NAME), {})[tweet_id] = doc
+        for thread_url, thread_targets in threads.items():
+            if thread_url:
+                refreshed += refresh_from_pages(fetcher, thread_url, thread_targets, db_collections, COMMENTS_DB)
+            missing += [(COMMENTS_DB, d) for d in thread_targets.values()]
+
+    not_found = 0
+    for db_key, doc in missing:
+        username = doc.get("repost_username_str") or doc.get("username_str")
+        single = {doc[ID_NAME]: doc}
+        refreshed += refresh_from_pages(fetcher, tweet_url(f"https://xcancel.com/{username}", doc[ID_NAME]), single, db_collections, db_key, max_pages=1)
+        not_found += len(single)
+    print(f"Refreshed stats of {refreshed} tweets and comments of {profile}, {not_found} not found.")
 
 
 def str_to_bool(value):
@@ -525,10 +957,14 @@ def str_to_bool(value):
         raise argparse.ArgumentTypeError('Boolean value expected.')
 
 
-def parse_arguments() -> argparse.Namespace:
-    """Parse command-line arguments."""
-    parser = argparse.ArgumentParser(description="Web scraper for X (formerly Twitter)")
-    parser.add_argument("-p", "--profile", required=True, type=str, help="Profile username to scrape.")
+def build_parser(parser_class: type = argparse.ArgumentParser) -> argparse.ArgumentParser:
+    """The command-line options, shared with the daemon (which validates its requests with them)."""
+    parser = parser_class(description="Web scraper for X (formerly Twitter)")
+    parser.add_argument("-p", "--profile", type=str, default=None, help="Profile username to scrape.")
+    parser.add_argument("--profiles-file", type=str, default=None, help="Batch mode: file with one profile username per line.")
+    parser.add_argument("--profiles-collection", type=str, default=None, help="Batch mode: collection in xdb whose documents hold a 'username_str' to scrape.")
+    parser.add_argument("--workers", type=int, default=1, help="Batch mode: number of worker processes, each with its own browser/session and DB connection.")
+    parser.add_argument("--global-rate", type=float, default=20, help="Batch mode: maximum pages per minute across all workers (0 for no limit).")
     parser.add_argument("-t", "--tweet", type=str, default=None, help="Status ID of a single tweet to scrape.")
     parser.add_argument("--max-comments", type=int, default=10, help="Maximum number of comments per tweet.")
     parser.add_argument("--max-tweets", type=int, default=10, help="Maximum number of tweets in profile to scrape.")
@@ -540,38 +976,386 @@ def parse_arguments() -> argparse.Namespace:
     default="none",
     help="Force rescraping: 'both' for tweets and comments, 'tweets' for tweets only, 'comments' for comments only, 'none' for no force.")
     parser.add_argument("--deep", action="store_true", help="Scrape comments of comments.")
-    
-    args = parser.parse_args()
-    args.profile = args.profile.lstrip('@')  # Remove '@' if provided
+    parser.add_argument("--initial-rate", type=float, default=3, help="Pages per minute to start with; the rate adapts to how the instance responds.")
+    parser.add_argument("--max-rate", type=float, default=30, help="Upper bound of the adaptive page rate (pages per minute).")
+    parser.add_argument("--blob-store", choices=["gridfs", "local"], default="gridfs", help="Where attachment binaries are stored: 'gridfs' (MongoDB) or 'local' (sharded directory).")
+    parser.add_argument("--blob-dir", type=str, default="./blobs", help="Directory of the local blob store.")
+    parser.add_argument("--max-media-size", type=float, default=MAX_MEDIA_MB, metavar="MB", help="Skip attachments larger than this (0 for no limit).")
+    parser.add_argument("--crawl-workers", type=int, default=1, help="Concurrent fetchers (browsers/sessions) for deep reply crawling.")
+    parser.add_argument("--max-depth", type=int, default=MAX_DEPTH, help="Maximum reply depth for deep scraping.")
+    parser.add_argument("--max-per-depth", type=int, default=0, help="Maximum reply threads crawled per depth level of one tweet (0 for no limit).")
+    parser.add_argument("--max-per-root", type=int, default=0, help="Maximum reply threads crawled per tweet (0 for no limit).")
+    parser.add_argument("--max-thread-pages", type=int, default=0, help="Maximum pages loaded per conversation or reply thread (0 for no limit).")
+    parser.add_argument("--page-budget", type=int, default=0, help="Maximum pages fetched by the whole run, shared by batch workers (0 for no limit); the most valuable threads are scraped first.")
+    parser.add_argument("--list-checkpoints", action="store_true", help="List saved crawl checkpoints and exit.")
+    parser.add_argument("--clear-checkpoints", type=int, default=None, metavar="DAYS", help="Delete checkpoints not updated for DAYS days (0 for all) and exit.")
+    parser.add_argument("--refresh-stats", nargs="?", const="both", choices=["tweets", "comments", "both"], default=None, help="Only refresh the engagement stats of stored tweets and/or comments (default both), storing a snapshot per tweet.")
+    parser.add_argument("--refresh-older-than", type=float, default=24, help="Stats refresh: only tweets whose stats are older than this many hours.")
+    parser.add_argument("--refresh-limit", type=int, default=0, help="Stats refresh: maximum tweets and maximum comments per profile, least recently refreshed first (0 for no limit).")
+    parser.add_argument("--index-report", action="store_true", help="Print size and usage of the database indexes and exit.")
+    parser.add_argument("--preload-hashes", action="store_true", help="Download the known tweet hashes of a profile/conversation once instead of looking each tweet up in the database.")
+    parser.add_argument("--enqueue", action="store_true", help="Job queue: add the profiles of -p, --profiles-file and --profiles-collection as jobs and exit.")
+    parser.add_argument("--priority", type=int, default=None, help="Job queue: priority of the profile jobs added with --enqueue (higher runs first).")
+    parser.add_argument("--worker", action="store_true", help="Job queue: run jobs from the shared queue (with --workers processes) until stopped.")
+    parser.add_argument("--drain", action="store_true", help="Job queue: let --worker exit once no jobs are queued or running.")
+    parser.add_argument("--jobs", action="store_true", help="Job queue: print the number of jobs per kind and state and exit.")
+    parser.add_argument("--engine", choices=["browser", "http"], default="browser", help="Fetch backend: 'browser' (Chrome) or 'http' (plain requests, falls back to Chrome when needed).")
+    parser.add_argument("--no-prefetch", action="store_true", help="Do not load the next timeline/conversation page while the current one is processed.")
+    parser.add_argument("--archive", type=str, default=None, metavar="DIR", help="Keep the raw HTML of every scraped timeline/conversation page in WARC files in this directory (see reparse.py).")
+    parser.add_argument("--page-cache", type=str, default=None, metavar="DIR", help="Keep fetched pages compressed in this directory and serve repeated visits from it.")
+    parser.add_argument("--cache-ttl-status", type=float, default=TTL_HOURS["status"], help="Page cache: hours a tweet/conversation page stays valid (0 to not cache them).")
+    parser.add_argument("--cache-ttl-timeline", type=float, default=TTL_HOURS["timeline"], help="Page cache: hours a profile timeline page stays valid (0 to not cache them).")
+    parser.add_argument("--cache-size", type=float, default=MAX_SIZE_MB, metavar="MB", help="Page cache: size limit, least recently used pages are deleted beyond it.")
+    parser.add_argument("--recycle-pages", type=int, default=RECYCLE_PAGES, help="Replace a browser after this many pages (0 to disable).")
+    parser.add_argument("--recycle-rss", type=float, default=RECYCLE_RSS_MB, metavar="MB", help="Replace a browser once it and its child processes use this much memory (0 to disable).")
+    parser.add_argument("--browser-spares", type=int, default=SPARES, help="Browsers started in the background when a browser nears its recycling limit.")
+    parser.add_argument("--json-log", type=str, default=None, help="Append structured JSON events (pages, downloads, writes, profiles) to this file, '-' for stderr.")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port at /metrics (batch worker i uses port + i).")
+    parser.add_argument("--metrics-textfile", type=str, default=None, help="Write Prometheus metrics to this file after every profile (one file per batch worker).")
+    return parser
+
+
+def parse_arguments(argv: Optional[List[str]] = None, parser: argparse.ArgumentParser = None) -> argparse.Namespace:
+    """Parse command-line arguments (``argv``, default ``sys.argv``)."""
+    parser = parser or build_parser()
+    args = parser.parse_args(argv)
+    if args.list_checkpoints or args.clear_checkpoints is not None or args.index_report or args.jobs:
+        return args
+    if args.worker:
+        if args.profile or args.profiles_file or args.profiles_collection or args.tweet or args.refresh_stats or args.enqueue:
+            parser.error("--worker takes its profiles from the job queue and cannot be combined with -p, -t, --profiles-file, --profiles-collection, --refresh-stats or --enqueue")
+        return args
+    if args.enqueue and (args.tweet or args.refresh_stats):
+        parser.error("--enqueue only queues profile jobs and cannot be combined with -t or --refresh-stats")
+    if not (args.profile or args.profiles_file or args.profiles_collection):
+        parser.error("one of -p/--profile, --profiles-file or --profiles-collection is required")
+    if args.tweet and (not args.profile or args.profiles_file or args.profiles_collection):
+        parser.error("-t/--tweet requires -p/--profile and cannot be combined with batch mode")
+    if args.tweet and args.refresh_stats:
+        parser.error("-t/--tweet cannot be combined with --refresh-stats")
+    if args.profile:
+        args.profile = args.profile.lstrip('@')  # Remove '@' if provided
     return args
 
 
-def main() -> None:
-    """Main function to manage the scraping process."""
-    args = parse_arguments()
-    db_collections = setup_database()
-    driver = setup_driver()
+def scrape_profile(args: argparse.Namespace, profile: str, fetchers: FetcherPool, db_collections: Any, dedup_index: DedupIndex, downloader: MediaDownloader) -> None:
+    """Scrapes one profile (or one of its tweets) and the requested comments.
+
+    Conversations of new tweets are scraped highest ``thread_score`` first, so
+    a run that hits its page budget has the most valuable threads. The ones
+    not scraped yet are kept in a checkpoint and taken up by the next run, as
+    is the reply crawl of a conversation that was interrupted.
+    """
+    profile_url = f"https://xcancel.com/{profile}"
+    fetcher = fetchers.primary
+    checkpoints = db_collections[CHECKPOINTS_DB]
+    scores: Dict[str, float] = {}
+
+    def scrape_thread(tweet_id: str, waiting_time: int) -> None:
+        thread_url = tweet_url(profile_url, tweet_id)
+        comments_scraped = scrape_tweets(fetcher, thread_url, db_collections, args.force, args.max_comments, False, waiting_time, args.attachments, 1, thread_url, dedup_index, downloader, scores, args.max_thread_pages)
+        if args.deep and not budget_exhausted(fetcher):
+            if comments_scraped:
+                print("Start deep scraping...")
+            # Also without new comments, a crawl checkpoint of an earlier run is resumed
+            crawl_replies(fetchers, db_collections, comments_scraped or [], args.force, args.max_comments, args.attachments, 2, thread_url, dedup_index, downloader, args.max_depth, args.max_per_depth, args.max_per_root, scores, args.max_thread_pages)
 
-    profile_url = f"https://xcancel.com/{args.profile}"
-    
     if args.tweet:
-        new_tweet = scrape_tweets(driver, tweet_url(profile_url, args.tweet), db_collections, args.force, 1, True, 0, args.attachments)
+        new_tweet = scrape_tweets(fetcher, tweet_url(profile_url, args.tweet), db_collections, args.force, 1, True, 0, args.attachments, dedup_index=dedup_index, downloader=downloader)
+        if args.max_comments > 0 and not budget_exhausted(fetcher):
+            scrape_thread(args.tweet, 0)
+    else:
+        checkpoint = checkpoints.load(f"threads:{profile_url}")
+        pending = checkpoint["pending_list"] if checkpoint else []
+        if pending:
+            print(f"Resuming the conversations of {len(pending)} tweets of an earlier run.")
+        new_tweets = scrape_tweets(fetcher, profile_url, db_collections, args.force, args.max_tweets, True, args.waiting_time, args.attachments, dedup_index=dedup_index, downloader=downloader, scores=scores)
         if args.max_comments > 0:
-            comments_scraped = scrape_tweets(driver, tweet_url(profile_url, args.tweet), db_collections, args.force, args.max_comments, False, 0, args.attachments, 1, tweet_url(profile_url, args.tweet))
-            if comments_scraped and args.deep:
-                print("Start deep scraping...")
-                deep_scrape(driver, db_collections, comments_scraped, args.force, args.max_comments, args.attachments, 2, tweet_url(profile_url, args.tweet))
+            for tweet_id, score in pending:
+                scores.setdefault(tweet_id, score)
+            tweet_ids = list(dict.fromkeys([*(new_tweets or []), *(tweet_id for tweet_id, _ in pending)]))
+            ranked = sorted(tweet_ids, key=lambda tweet_id: -scores.get(tweet_id, 0.0))  # Stable, so ties keep timeline order
+            failed = []
+            for i, tweet_id in enumerate(ranked):
+                if budget_exhausted(fetcher):
+                    print(f"Page budget used up, skipping the comments of {len(ranked) - i} tweets.")
+                    return
+                # Saved with the current tweet, an interrupted conversation is redone
+                checkpoints.save_threads(profile_url, [[t, scores.get(t, 0.0)] for t in failed + ranked[i:]])
+                try:
+                    scrape_thread(tweet_id, args.waiting_time)
+                except ScrapeFailed as e:
+                    print(f"Scraping the conversation failed: {e}")
+                    failed.append(tweet_id)
+            if failed:
+                checkpoints.save_threads(profile_url, [[t, scores.get(t, 0.0)] for t in failed])
+                raise ScrapeFailed(f"{len(failed)} of {len(ranked)} conversations of {profile} failed, they are retried on the next run")
+            if ranked:
+                checkpoints.clear(f"threads:{profile_url}")
+
+
+def run_job(args: argparse.Namespace, job: Dict[str, Any], fetchers: FetcherPool, db_collections: Any, dedup_index: DedupIndex, downloader: MediaDownloader) -> None:
+    """Runs one job of the shared queue and queues the jobs it uncovers.
+
+    A profile job scrapes the timeline and queues a conversation job per new
+    tweet with replies; with ``--deep`` conversation and reply jobs queue a
+    reply job per comment with replies, down to ``--max-depth``. How much is
+    scraped follows the options of the worker that runs the job. A request
+    job of the daemon carries its own options and runs like a command line.
+    """
+    jobs = db_collections[JOBS_DB]
+    fetcher = fetchers.primary
+    kind, target, profile = job["kind_str"], job["target_str"], job["profile_str"]
+    if kind == "request":
+        request = job["payload"]["args"]
+        if request.refresh_stats:
+            refresh_stats(request, profile, fetchers, db_collections)
+        else:
+            scrape_profile(request, profile, fetchers, db_collections, dedup_index, downloader)
+        return
+    requeue = args.force in ["both", "comments"]
+    if kind == "profile":
+        profile_url = f"https://xcancel.com/{profile}"
+        new_tweets = scrape_tweets(fetcher, profile_url, db_collections, args.force, args.max_tweets, True, args.waiting_time, args.attachments, dedup_index=dedup_index, downloader=downloader)
+        if args.max_comments > 0:
+            for tweet_id in new_tweets or []:
+                jobs.enqueue("conversation", tweet_url(profile_url, tweet_id), profile, requeue=requeue)
+        return
+    depth = job["payload"].get("depth", 1)
+    profile_tweet = job["payload"].get("profile_tweet", target)
+    comments = scrape_tweets(fetcher, target, db_collections, args.force, args.max_comments, False, args.waiting_time if kind == "conversation" else 0, args.attachments, depth, profile_tweet, dedup_index, downloader, max_pages=args.max_thread_pages)
+    if args.deep and depth + 1 < args.max_depth:
+        for url in comments or []:
+            jobs.enqueue("replies", url, profile, {"profile_tweet": profile_tweet, "depth": depth + 1}, requeue=requeue)
+
+
+def scrape_profiles(args: argparse.Namespace, profiles: Any, budget: PolitenessBudget = None, jobs: JobQueue = None, warm: bool = False) -> List[Dict[str, Any]]:
+    """Scrapes profiles one after another with one browser/session and DB connection.
+
+    ``profiles`` is any iterable of usernames (a list, or a queue drained by a
+    batch worker), or of jobs claimed from ``jobs`` (a ``JobQueue`` or the
+    daemon's queue). A job is completed only after its documents are written.
+    With ``warm`` the browser is started right away instead of on the first
+    page. Returns one summary per profile or job.
+    """
+    writer = BulkWriter()
+    db_collections = setup_database(writer)
+    limiter = AdaptiveRateLimiter(args.initial_rate, args.max_rate)
+    drivers = DriverPool(setup_driver, args.browser_spares, args.recycle_pages, args.recycle_rss)
+    cache = None
+    if args.page_cache and not args.refresh_stats:  # A stats refresh needs current pages
+        cache = PageCache(args.page_cache, {"status": args.cache_ttl_status, "timeline": args.cache_ttl_timeline}, args.cache_size)
+    fetchers = FetcherPool(lambda: setup_fetcher(args.engine, drivers, limiter, budget, cache, not args.no_prefetch), args.crawl_workers)
+    if args.archive:
+        db_collections[ARCHIVE_NAME] = PageArchive(args.archive)
+    dedup_index = DedupIndex(preload=args.preload_hashes)
+    downloader = MediaDownloader(open_blob_store(args.blob_store, db_collections[ATTACHMENTS_DB].database, args.blob_dir), max_media_mb=args.max_media_size)
+    summaries = []
+    if warm and args.engine == "browser":
+        drivers.prepare()
+
+    try:
+        items = iter(profiles)
+        while True:
+            if budget is not None and budget.exhausted():
+                print(f"Page budget of {budget.max_pages} pages used up, not starting further profiles or jobs.")
+                break
+            item = next(items, None)  # Only taken once it can run, so jobs stay queued
+            if item is None:
+                break
+            job = item if jobs is not None else None
+            profile = job["profile_str"] if job is not None else item
+            if job is not None and dedup_index.scopes:
+                # Workers and daemon lanes run indefinitely, known hashes are only kept per job
+                dedup_index = DedupIndex(preload=args.preload_hashes)
+            start = time.monotonic()
+            pages = fetchers.pages_fetched()
+            written = writer.written
+            status = "ok"
+            metrics.profile = profile
+            metrics.event("profile_started", job=job["_id"] if job is not None else None)
+
+            def progress() -> Dict[str, Any]:
+                return {"pages": fetchers.pages_fetched() - pages, "documents": writer.written - written, "seconds": time.monotonic() - start}
+
+            try:
+                if job is not None:
+                    with jobs.lease(job, progress=progress):
+                        run_job(args, job, fetchers, db_collections, dedup_index, downloader)
+                elif args.refresh_stats:
+                    refresh_stats(args, profile, fetchers, db_collections)
+                else:
+                    scrape_profile(args, profile, fetchers, db_collections, dedup_index, downloader)
+            except Exception as e:
+                print(f"Scraping {profile} failed: {e}")
+                status = f"failed: {e}"
+            writer.flush()
+            summary = {"profile": job["_id"] if job is not None else profile, "status": status, **progress()}
+            if job is not None:
+                jobs.complete(job, summary) if status == "ok" else jobs.fail(job, status, summary)
+            summaries.append(summary)
+            metrics.event("profile_finished", **summary)
+            metrics.write_textfile()
+    finally:
+        downloader.close()
+        writer.close()
+        dedup_index.report()
+        fetchers.report()
+        drivers.report()
+        if cache is not None:
+            cache.report()
+        if args.archive:
+            db_collections[ARCHIVE_NAME].report()
+        limiter.report()
+        downloader.report()
+        writer.report()
+        metrics.report()
+        fetchers.close()
+        drivers.close()
+        if cache is not None:
+            cache.close()
+        if args.archive:
+            db_collections[ARCHIVE_NAME].close()
+        metrics.close()
+    return summaries
+
+
+def iter_queue(jobs: multiprocessing.Queue) -> Any:
+    """Yields profiles from a batch queue until the ``None`` sentinel."""
+    while True:
+        profile = jobs.get()
+        if profile is None:
+            return
+        yield profile
+
+
+def batch_worker(args: argparse.Namespace, jobs: multiprocessing.Queue, results: multiprocessing.Queue, budget: PolitenessBudget, index: int = 0) -> None:
+    """Worker process of a batch run: pulls profiles until the queue is drained."""
+    port = args.metrics_port + index if args.metrics_port else None
+    metrics.configure(args.json_log, args.metrics_textfile, port, worker=f"worker-{index}")
+    for summary in scrape_profiles(args, iter_queue(jobs), budget):
+        results.put(summary)
+    results.put(None)
+
+
+def queue_worker(args: argparse.Namespace, budget: PolitenessBudget, index: int = 0) -> None:
+    """Worker process of the shared job queue: runs jobs until stopped (or, with ``--drain``, until none are left)."""
+    if args.workers > 1:
+        port = args.metrics_port + index if args.metrics_port else None
+        metrics.configure(args.json_log, args.metrics_textfile, port, worker=f"worker-{index}")
     else:
-        new_tweets = scrape_tweets(driver, profile_url, db_collections, args.force, args.max_tweets, True, args.waiting_time, args.attachments)
-        if new_tweets and args.max_comments > 0:
-            for tweet_id in new_tweets:
-                comments_scraped = scrape_tweets(driver, tweet_url(profile_url, tweet_id), db_collections, args.force, args.max_comments, False, args.waiting_time, args.attachments, 1, tweet_url(profile_url, tweet_id))
-                if comments_scraped and args.deep:
-                    print("Start deep scraping...")
-                    deep_scrape(driver, db_collections, comments_scraped, args.force, args.max_comments, args.attachments, 2, tweet_url(profile_url, tweet_id))
-    
+        metrics.configure(args.json_log, args.metrics_textfile, args.metrics_port)
+    jobs = setup_database()[JOBS_DB]
+    jobs.ensure_indexes()
+    print(f"Worker {jobs.owner} waiting for jobs...")
+    summaries = scrape_profiles(args, jobs.iter_jobs(args.drain), budget, jobs)
+    print(f"Worker {jobs.owner} finished {len(summaries)} jobs.")
+
+
+def load_profiles(args: argparse.Namespace) -> List[str]:
+    """Collects the profiles of a batch run from -p, --profiles-file and --profiles-collection."""
+    profiles = [args.profile] if args.profile else []
+    if args.profiles_file:
+        with open(args.profiles_file, "r") as f_open:
+            for line in f_open:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    profiles.append(line.lstrip("@"))
+    if args.profiles_collection:
+        db = mongo_authenticate("./")["xdb"]
+        profiles += [d["username_str"].lstrip("@") for d in db[args.profiles_collection].find({}, {"username_str": 1, "_id": 0}) if d.get("username_str")]
+    return list(dict.fromkeys(profiles))  # Unique, order preserved
+
+
+def print_summary(summaries: List[Dict[str, Any]], seconds: float) -> None:
+    print(f"{'Profile':<24}{'Status':<12}{'Pages':>8}{'Docs':>8}{'Seconds':>10}")
+    for s in summaries:
+        print(f"{s['profile']:<24}{s['status'][:11]:<12}{s['pages']:>8}{s['documents']:>8}{s['seconds']:>10.1f}")
+    print(f"{len(summaries)} profiles, {sum(s['pages'] for s in summaries)} pages, {sum(s['documents'] for s in summaries)} documents in {seconds:.1f}s.")
+
+
+def main() -> None:
+    """Main function to manage the scraping process."""
+    args = parse_arguments()
+    start = time.monotonic()
+
+    if args.list_checkpoints or args.clear_checkpoints is not None:
+        checkpoints = setup_database()[CHECKPOINTS_DB]
+        if args.clear_checkpoints is not None:
+            print(f"Deleted {checkpoints.clear_older_than(args.clear_checkpoints)} checkpoints.")
+        if args.list_checkpoints:
+            print_checkpoints(checkpoints)
+        return
+
+    if args.index_report:
+        print_index_report(setup_database()[PROFILE_DB].database)
+        return
+
+    if args.jobs:
+        print_jobs(setup_database()[JOBS_DB])
+        return
+
+    if args.enqueue:
+        jobs = setup_database()[JOBS_DB]
+        jobs.ensure_indexes()
+        profiles = load_profiles(args)
+        queued = sum(jobs.enqueue("profile", profile, profile, priority=args.priority, requeue=True) for profile in profiles)
+        print(f"Queued {queued} of {len(profiles)} profiles ({len(profiles) - queued} already queued or running).")
+        return
+
+    if args.worker:
+        budget = PolitenessBudget(args.global_rate, args.page_budget)
+        processes = [multiprocessing.Process(target=queue_worker, args=(args, budget, i), name=f"worker-{i}") for i in range(max(1, args.workers))]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        print_jobs(setup_database()[JOBS_DB])
+        return
+
+    if not (args.profiles_file or args.profiles_collection):
+        metrics.configure(args.json_log, args.metrics_textfile, args.metrics_port)
+        scrape_profiles(args, [args.profile], PolitenessBudget(0, args.page_budget))
+        print("Scraping completed.")
+        return
+
+    profiles = load_profiles(args)
+    workers = max(1, min(args.workers, len(profiles)))
+    budget = PolitenessBudget(args.global_rate, args.page_budget)
+    print(f"Batch scraping {len(profiles)} profiles with {workers} workers...")
+
+    jobs = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    for profile in profiles:
+        jobs.put(profile)
+    for _ in range(workers):
+        jobs.put(None)
+    processes = [multiprocessing.Process(target=batch_worker, args=(args, jobs, results, budget, i), name=f"worker-{i}") for i in range(workers)]
+    for process in processes:
+        process.start()
+
+    summaries = []
+    finished = 0
+    while finished < workers:
+        try:
+            summary = results.get(timeout=5)
+        except queue.Empty:
+            if not any(p.is_alive() for p in processes):
+                print("All workers exited, some without reporting.")
+                break
+            continue
+        if summary is None:
+            finished += 1
+        else:
+            summaries.append(summary)
+    for process in processes:
+        process.join()
+
+    print_summary(summaries, time.monotonic() - start)
+    metrics.configure(args.json_log)
+    metrics.event("batch_finished", profiles=len(summaries), pages=sum(s["pages"] for s in summaries), documents=sum(s["documents"] for s in summaries), seconds=time.monotonic() - start)
+    metrics.close()
     print("Scraping completed.")
-    driver.quit()
 
 
 if __name__ == '__main__':
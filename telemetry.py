@@ -0,0 +1,255 @@
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+STAGE_METRIC = "scraper_stage_seconds"
+METRIC_HELP = {
+    STAGE_METRIC: "Time spent per scraping stage and profile.",
+    "scraper_pages_total": "Pages fetched per backend and profile.",
+    "scraper_rate_limited_total": "Pages answered with a rate limit.",
+    "scraper_retries_total": "Retried page loads per reason.",
+    "scraper_bytes_total": "Bytes downloaded per kind (page HTML or media).",
+    "scraper_documents_total": "Documents stored per collection and profile.",
+    "scraper_media_failures_total": "Attachment downloads that failed.",
+    "scraper_browser_fallbacks_total": "HTTP pages that had to be fetched again through the browser.",
+    "scraper_browser_restarts_total": "Browsers replaced per reason (pages, memory, crash).",
+    "scraper_prefetch_total": "Pages loaded ahead while the previous page was processed, per result (used, discarded).",
+    "scraper_queue_depth": "Items waiting per pipeline stage (prefetch, media, db).",
+    "scraper_cache_lookups_total": "Page cache lookups per result (hit, miss, expired).",
+    "scraper_browser_rss_bytes": "Resident memory of the most recently measured browser and its child processes.",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class ProfileLabel:
+    """The profile being scraped, shared by a scraping thread and its helper threads."""
+
+    def __init__(self):
+        self.profile = ""
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Telemetry:
+    """Process-wide counters, stage histograms and structured event log.
+
+    Components record into the shared ``metrics`` instance; nothing is emitted
+    unless ``configure`` enabled a JSON log, a Prometheus textfile or a
+    ``/metrics`` endpoint. The current profile labels every sample. Profiles
+    are scraped one after another per process, so by default it is a single
+    process-wide label; a thread that scrapes next to others (a daemon lane)
+    takes a label of its own with ``own_profile``, and the crawler, prefetch,
+    download and writer threads it starts record under it through ``bind``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Labels, Histogram] = {}
+        self.default_label = ProfileLabel()
+        self.local = threading.local()
+        self.worker = ""
+        self.log: Optional[TextIO] = None
+        self.textfile: Optional[str] = None
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    def configure(self, json_log: Optional[str] = None, textfile: Optional[str] = None, port: Optional[int] = None, worker: str = "") -> None:
+        """Enables the outputs: JSON lines to ``json_log`` ('-' for stderr), a textfile, an HTTP endpoint."""
+        self.worker = worker
+        if json_log:
+            self.log = sys.stderr if json_log == "-" else open(json_log, "a", buffering=1, encoding="utf-8")
+        if textfile:
+            # One file per batch worker; a textfile collector reads them all
+            root, ext = os.path.splitext(textfile)
+            self.textfile = f"{root}.{worker}{ext}" if worker else textfile
+        if port:
+            self.serve(port)
+
+    @property
+    def label(self) -> ProfileLabel:
+        return getattr(self.local, "label", self.default_label)
+
+    @property
+    def profile(self) -> str:
+        return self.label.profile
+
+    @profile.setter
+    def profile(self, value: str) -> None:
+        self.label.profile = value
+
+    def own_profile(self) -> None:
+        """Gives the calling thread a profile label of its own."""
+        self.local.label = ProfileLabel()
+
+    def bind(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """Wraps ``fn`` so it records under the calling thread's profile label on any thread."""
+        label = self.label
+
+        def bound(*args: Any, **kwargs: Any) -> Any:
+            self.local.label = label
+            return fn(*args, **kwargs)
+        return bound
+
+    def _labels(self, labels: Dict[str, Any]) -> Labels:
+        labels = {"profile": self.profile, **labels}
+        if self.worker:
+            labels["worker"] = self.worker
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = (name, self._labels(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        key = (name, self._labels(labels))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, stage: str, seconds: float, **labels: Any) -> None:
+        key = self._labels({"stage": stage, **labels})
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str, **labels: Any) -> Iterator[None]:
+        """Records the time spent in the ``with`` block as ``stage``."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - start, **labels)
+
+    def event(self, name: str, **fields: Any) -> None:
+        """Writes one JSON log line if a JSON log is configured."""
+        if self.log is None:
+            return
+        record = {"ts": datetime.utcnow().isoformat(), "event": name, "profile": self.profile, "pid": os.getpid(), **fields}
+        if self.worker:
+            record["worker"] = self.worker
+        line = json.dumps(record, default=str) + "\n"
+        with self.lock:
+            self.log.write(line)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted((k, h.counts[:], h.sum, h.count) for k, h in self.histograms.items())
+        lines: List[str] = []
+        written = set()
+
+        def header(name: str, kind: str) -> None:
+            if name not in written:
+                written.add(name)
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{format_labels(labels)} {value:g}")
+        for (name, labels), value in gauges:
+            header(name, "gauge")
+            lines.append(f"{name}{format_labels(labels)} {value:g}")
+        for labels, counts, total, count in histograms:
+            header(STAGE_METRIC, "histogram")
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{STAGE_METRIC}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{STAGE_METRIC}_sum{format_labels(labels)} {total:.6f}")
+            lines.append(f"{STAGE_METRIC}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self) -> None:
+        """Atomically rewrites the Prometheus textfile, if one is configured."""
+        if self.textfile is None:
+            return
+        temp = f"{self.textfile}.{os.getpid()}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(temp, self.textfile)
+
+    def serve(self, port: int) -> None:
+        """Serves ``/metrics`` on ``port`` from a daemon thread."""
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass  # Keep scrapes of the endpoint out of the scraper output
+
+        self.server = ThreadingHTTPServer(("", port), Handler)
+        threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True).start()
+        print(f"Serving metrics on port {port}.")
+
+    def stage_summary(self) -> Dict[str, Tuple[int, float]]:
+        """Calls and total seconds per stage, summed over all profiles."""
+        summary: Dict[str, Tuple[int, float]] = {}
+        with self.lock:
+            for labels, h in self.histograms.items():
+                stage = dict(labels)["stage"]
+                count, total = summary.get(stage, (0, 0.0))
+                summary[stage] = (count + h.count, total + h.sum)
+        return summary
+
+    def report(self) -> None:
+        for stage, (count, total) in sorted(self.stage_summary().items(), key=lambda s: -s[1][1]):
+            print(f"Stage {stage}: {count} calls, {total:.1f}s total, {total / count * 1000 if count else 0:.0f} ms average.")
+
+    def close(self) -> None:
+        self.write_textfile()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+        if self.log is not None and self.log is not sys.stderr:
+            self.log.close()
+        self.log = None
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (k + '="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+metrics = Telemetry()
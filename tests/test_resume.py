@@ -0,0 +1,114 @@
+"""Resuming interrupted runs from their checkpoints, against an in-memory MongoDB and the benchmark fixtures."""
+import os
+import re
+import sys
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scraper  # noqa: E402
+from checkpoints import CheckpointStore  # noqa: E402
+from dedup_index import DedupIndex  # noqa: E402
+from fetcher import FetcherPool, Page, PageFetcher  # noqa: E402
+from rate_limit import AdaptiveRateLimiter  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures")
+PROFILE = "someone"
+TWEET = "1895100000000000000"
+
+
+def fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class FakeFetcher(PageFetcher):
+    """Serves the fixtures, made unique per URL; ``fail`` URLs raise and the ``interrupt_after``th page stops the run."""
+
+    name = "fake"
+
+    def __init__(self, fail=(), interrupt_after=0):
+        super().__init__(AdaptiveRateLimiter(6000, 6000), prefetching=False)
+        self.timeline, self.thread, self.end = fixture("timeline_page.html"), fixture("thread_page.html"), fixture("timeline_end.html")
+        self.fail = set(fail)
+        self.interrupt_after = interrupt_after
+        self.urls = []
+
+    def _fetch(self, url: str) -> Page:
+        self.urls.append(url)
+        if self.interrupt_after and len(self.urls) >= self.interrupt_after:
+            raise KeyboardInterrupt
+        if url.split("?")[0] in self.fail:
+            raise RuntimeError("connection reset")
+        if "cursor=" in url:
+            return Page(url, self.end, backend="fake")
+        html = self.thread if "/status/" in url else self.timeline
+        html = html.replace('class="tweet-content media-body" dir="auto">', f'class="tweet-content media-body" dir="auto">{url} ')
+        return Page(url, html, backend="fake")
+
+
+def setup():
+    db = mongomock.MongoClient().db
+    db_collections = {k: db[k] for k in ["tweets", "comments", "profile", "attachments", "stats_snapshots"]}
+    db_collections["checkpoints"] = CheckpointStore(db["checkpoints"])
+    return db, db_collections
+
+
+def run(db_collections, fetcher, *argv):
+    args = scraper.parse_arguments(["-p", PROFILE, "--attachments", "no", "--max-comments", "3", *argv])
+    scraper.scrape_profile(args, PROFILE, FetcherPool(lambda: fetcher, 1), db_collections, DedupIndex(), None)
+
+
+def crawled(fetcher):
+    root = scraper.tweet_url(f"https://xcancel.com/{PROFILE}", TWEET)
+    return [url for url in fetcher.urls if "/status/" in url and not url.startswith(root)]
+
+
+def test_interrupted_reply_crawl_is_resumed_without_new_comments():
+    db, db_collections = setup()
+    first = FakeFetcher(interrupt_after=3)
+    with pytest.raises(KeyboardInterrupt):
+        run(db_collections, first, "-t", TWEET, "--deep")
+    pending = db.checkpoints.find_one({"kind_str": "frontier"})["pending_list"]
+    assert pending
+
+    second = FakeFetcher()
+    run(db_collections, second, "-t", TWEET, "--deep")
+    assert {url for url, *_ in pending} <= {url.split("?")[0] for url in crawled(second)}
+    assert db.checkpoints.count_documents({}) == 0
+
+
+def test_failed_reply_thread_is_retried_by_the_next_run():
+    db, db_collections = setup()
+    run(db_collections, FakeFetcher(), "-t", TWEET)  # Stores the root conversation
+    root = scraper.tweet_url(f"https://xcancel.com/{PROFILE}", TWEET)
+    replies = [f"https://xcancel.com/{d['username_str']}/status/{d['tweet_id_str']}" for d in db.comments.find({"replies_int": {"$gt": 0}})]
+    broken = replies[0]
+    db_collections["checkpoints"].save_frontier(root, [[url, 2, 0.0] for url in replies], [])
+
+    first = FakeFetcher(fail=[broken])
+    with pytest.raises(scraper.ScrapeFailed):
+        run(db_collections, first, "-t", TWEET, "--deep")
+    assert crawled(first).count(broken) == scraper.MAX_ATTEMPTS ** 2  # Page attempts per crawl attempt
+    assert [url for url, *_ in db.checkpoints.find_one({"_id": f"crawl:{root}"})["pending_list"]] == [broken]
+
+    second = FakeFetcher()
+    run(db_collections, second, "-t", TWEET, "--deep")
+    assert broken in crawled(second)
+    assert db.checkpoints.count_documents({}) == 0
+
+
+def test_interrupted_timeline_pass_resumes_its_conversations():
+    db, db_collections = setup()
+    first = FakeFetcher(interrupt_after=3)
+    with pytest.raises(KeyboardInterrupt):
+        run(db_collections, first)
+    pending = db.checkpoints.find_one({"_id": f"threads:https://xcancel.com/{PROFILE}"})["pending_list"]
+    assert pending
+
+    second = FakeFetcher()
+    run(db_collections, second)
+    visited = {re.sub(r"#.*|\?.*", "", url).rsplit("/", 1)[-1] for url in second.urls if "/status/" in url}
+    assert {tweet_id for tweet_id, _ in pending} <= visited
+    assert db.checkpoints.count_documents({}) == 0